@@ -5,6 +5,7 @@ import json
 import os
 import re
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 from pathlib import Path
 from typing import Mapping, Optional, Sequence
@@ -20,17 +21,40 @@ from pdr.pdr import Data
 from pdr.utils import check_cases
 
 from pdr_tests.definitions import RULES_MODULES
+from pdr_tests.utilz.browse_utilz import (
+    BrowseDumper,
+    browse_is_current,
+    browse_tag,
+    clear_browse,
+    record_browse,
+    unhashed_digests,
+)
 from pdr_tests.utilz.ix_utilz import (
     get_product_row,
+    try_product_row,
     console_and_log,
-    stamp,
+    init_worker_logging,
+    log_context,
     verbose_temp_download,
+    worker_log_queue,
+    fetch_label_heads,
     assemble_urls,
     flip_ends_with,
+    just_hash,
+    load_and_hash,
     read_and_hash,
     record_comparison,
     find_manifest, _casecheck_wrap,
 )
+from pdr_tests.utilz.index_utilz import read_index, write_index
+from pdr_tests.utilz.manifest_utilz import (
+    iter_manifest_batches,
+    manifest_file,
+    read_manifest,
+    row_group_offsets,
+    take_manifest_rows,
+)
+from pdr_tests.utilz.result_utilz import new_run_id, write_test_results
 
 
 # ############ INDEX & TESTING CLASSES #############
@@ -72,9 +96,18 @@ class DatasetDefinition:
     def product_data_path(self, product_type):
         return Path(self.data_path, product_type)
 
+    def label_head_path(self, product_type):
+        """labels fetched from attached-label files by 'ix index --label-only'"""
+        return Path(self.data_path, "label_heads", product_type)
+
     def index_path(self, product_type):
         return Path(self.def_path, f"{product_type}.csv")
 
+    def index_error_path(self, product_type):
+        return Path(
+            self.def_path, "sample_lists", f"{product_type}_index_errors.csv"
+        )
+
     def test_path(self, product_type):
         return Path(self.def_path, f"{product_type}_test.csv")
 
@@ -143,7 +176,7 @@ class ProductPicker(DatasetDefinition):
                 self.rules[product_type]["manifest"],
                 manifest_dir
             )
-            manifest_parquet = parquet.ParquetFile(manifest)
+            manifest_parquet = manifest_file(manifest)
             results = []
             for group_ix in range(manifest_parquet.num_row_groups):
                 results.append(
@@ -206,52 +239,156 @@ class ProductPicker(DatasetDefinition):
         product_types: Optional[str],
         subset_size: int = 200,
         max_size: float = 8000,
+        seed: Optional[int] = None,
+        stratify: bool = False,
     ):
         """
         randomly select a subset of products from a given product type; write
         this subset to disk as a csv file. optionally specify subset size and
-        cap file size in MB.
+        cap file size in MB. picks are unique; pass seed for reproducible
+        picks. if stratify is True, spread picks across volumes, directory
+        layouts and size buckets (see stratified_pick) rather than picking
+        uniformly.
         """
+        rng = np.random.default_rng(seed)
         for product_type in self.expand_product_types(product_types):
             print(
                 f"picking test subset for {self.dataset} {product_type} ...... ",
                 end="",
             )
-            max_bytes = max_size * 10**6
             complete = self.complete_list_path(product_type)
             subset = self.subset_list_path(product_type)
-            total = parquet.read_metadata(complete).num_rows
-            if total < subset_size:
-                # pick them all (if not too big)
-                small_enough = parquet.read_table(
-                    complete, filters=[("size", "<", max_bytes)]
-                )
-                print(
-                    f"{total} products; {len(small_enough)}/{total} < {max_size} "
-                    f"MB cutoff; taking all {len(small_enough)}"
-                )
-                small_enough.to_pandas().to_csv(subset, index=None)
-                continue
-            sizes = parquet.read_table(complete, columns=["size"])[
-                "size"
-            ].to_numpy()
-            small_enough_ix = np.nonzero(sizes < max_bytes)[0]
-            pick_ix = np.sort(np.random.choice(small_enough_ix, subset_size))
+            pick_rows = stratified_pick_rows if stratify else reservoir_pick
+            pick_ix, n_small = pick_rows(
+                complete, subset_size, max_size * 10**6, rng
+            )
+            total = row_group_offsets(complete)[-1]
+            if n_small <= subset_size:
+                how = f"taking all {n_small}"
+            elif stratify:
+                how = f"picking {subset_size} by stratum"
+            else:
+                how = f"randomly picking {subset_size}"
             print(
-                f"{total} products; {len(small_enough_ix)}/{total} < {max_size} "
-                f"MB cutoff; randomly picking {subset_size}"
+                f"{total} products; {n_small}/{total} < {max_size} "
+                f"MB cutoff; {how}"
             )
-            # TODO: this is not very clever
-            ix_base, picks = 0, []
-            complete_parquet = parquet.ParquetFile(complete)
-            for group_ix in range(complete_parquet.num_row_groups):
-                group = complete_parquet.read_row_group(group_ix)
-                available = [
-                    ix - ix_base for ix in pick_ix if ix - ix_base < len(group)
-                ]
-                if len(available) != 0:
-                    picks.append(group.take(available))
-            pa.concat_tables(picks).to_pandas().to_csv(subset, index=None)
+            picks = take_manifest_rows(complete, pick_ix)
+            picks.to_pandas().to_csv(subset, index=None)
+
+
+def reservoir_pick(
+    path: Path,
+    subset_size: int,
+    max_bytes: float,
+    rng: np.random.Generator,
+) -> tuple[np.ndarray, int]:
+    """
+    pick up to subset_size unique rows, uniformly at random, from the rows of
+    a product list whose 'size' is less than max_bytes, streaming only its
+    'size' column once. each eligible row gets a random key, and the rows
+    with the subset_size smallest keys are kept (a reservoir sample).
+    returns sorted row indices of the picks and the number of eligible rows.
+    """
+    pick_ix = np.array([], dtype=np.int64)
+    pick_keys = np.array([], dtype=np.float64)
+    offset, n_small = 0, 0
+    for batch in iter_manifest_batches(path, columns=["size"]):
+        sizes = batch["size"].to_numpy(zero_copy_only=False)
+        small_ix = np.nonzero(sizes < max_bytes)[0] + offset
+        offset += len(batch)
+        n_small += len(small_ix)
+        pick_ix = np.concatenate([pick_ix, small_ix])
+        pick_keys = np.concatenate([pick_keys, rng.random(len(small_ix))])
+        if len(pick_ix) > subset_size:
+            keep = np.argpartition(pick_keys, subset_size)[:subset_size]
+            pick_ix, pick_keys = pick_ix[keep], pick_keys[keep]
+    return np.sort(pick_ix), n_small
+
+
+def directory_layout(directories: pd.Series) -> pd.Series:
+    """
+    mask digits in directory paths, so that e.g. orbit or sol directories
+    that differ only by number count as the same layout.
+    """
+    return directories.fillna("").str.replace(r"\d", "#", regex=True)
+
+
+def stratified_pick(
+    strata: pd.DataFrame, subset_size: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    choose up to subset_size rows of 'strata', which must have 'volume',
+    'directory', 'size' and 'format' columns. a stratum is a volume,
+    directory and order-of-magnitude size bucket. every stratum gets a pick
+    before any stratum gets a second one, and strata are taken in turn from
+    each volume, so rare volumes and layouts are not crowded out by common
+    ones. within a stratum, the smallest product of each format comes first.
+    returns sorted positional indices of picks.
+    """
+    df = pd.DataFrame(
+        {
+            "position": np.arange(len(strata)),
+            "volume": strata["volume"].fillna("").to_numpy(),
+            "directory": strata["directory"].fillna("").to_numpy(),
+            "size": strata["size"].fillna(0).to_numpy(),
+            "format": strata["format"].fillna("").to_numpy(),
+            "tiebreak": rng.random(len(strata)),
+        }
+    )
+    df["bucket"] = np.floor(np.log10(df["size"].clip(lower=1))).astype(int)
+    stratum = ["volume", "directory", "bucket"]
+    df = df.sort_values(["size", "tiebreak"])
+    df["format_rank"] = df.groupby(stratum + ["format"]).cumcount()
+    df = df.sort_values(["format_rank", "size", "tiebreak"])
+    df["stratum_rank"] = df.groupby(stratum).cumcount()
+    # random order of strata within each volume, and of volumes
+    keys = df[stratum].drop_duplicates().reset_index(drop=True)
+    keys["volume_turn"] = (
+        keys.assign(r=rng.random(len(keys)))
+        .groupby("volume")["r"]
+        .rank(method="first")
+    )
+    volumes = keys["volume"].unique()
+    keys["volume_order"] = keys["volume"].map(
+        dict(zip(volumes, rng.permutation(len(volumes))))
+    )
+    df = df.merge(keys, on=stratum)
+    df = df.sort_values(["stratum_rank", "volume_turn", "volume_order"])
+    return np.sort(df["position"].to_numpy()[:subset_size])
+
+
+def stratified_pick_rows(
+    path: Path,
+    subset_size: int,
+    max_bytes: float,
+    rng: np.random.Generator,
+) -> tuple[np.ndarray, int]:
+    """
+    stratified_pick() over the rows of a product list whose 'size' is less
+    than max_bytes. returns sorted row indices of the picks and the number
+    of eligible rows.
+    """
+    names = manifest_file(path).schema_arrow.names
+    table = read_manifest(
+        path,
+        columns=[
+            c for c in ("url", "filename", "size", "volume") if c in names
+        ],
+    ).to_pandas()
+    small_ix = np.nonzero(table["size"].to_numpy() < max_bytes)[0]
+    table = table.iloc[small_ix]
+    strata = pd.DataFrame(
+        {
+            "volume": table["volume"] if "volume" in table else "",
+            "directory": directory_layout(table["url"]),
+            "size": table["size"],
+            "format": table["filename"].str.extract(
+                r"(\.[^.]*)$", expand=False
+            ).str.lower(),
+        }
+    )
+    return small_ix[stratified_pick(strata, subset_size, rng)], len(small_ix)
 
 
 class IndexMaker(DatasetDefinition):
@@ -259,23 +396,43 @@ class IndexMaker(DatasetDefinition):
         super().__init__(name, data_root, browse_root)
 
     def get_labels(self, product_types: Optional[str], dry_run: bool = False,
-                   add_req_headers={}):
+                   add_req_headers={}, label_only: bool = False):
+        """
+        download the labels of each product in the subset. if label_only is
+        True, for attached-label product types, fetch only the label at the
+        start of each file rather than the whole file.
+        """
         for product_type in self.expand_product_types(product_types):
             self.data_mkdirs(product_type)
             dry = "" if dry_run is False else "(dry run)"
             print(f"Downloading labels for {self.dataset} {product_type} {dry}")
-            subset, needed = self.load_subset_table(product_type)
+            subset, needed = self.load_subset_table(
+                product_type, label_only=label_only
+            )
             if dry_run is True:
                 continue
             if len(needed) == 0:
                 continue
+            if label_only and self.rules[product_type]["label"] == "A":
+                fetch_label_heads(
+                    needed, self.label_head_path(product_type), add_req_headers
+                )
+                continue
             verbose_temp_download(
                 needed,
                 self.product_data_path(product_type),
-                add_req_headers,
+                add_req_headers=add_req_headers,
             )
 
-    def load_subset_table(self, product_type: str, verbose: bool = True):
+    def load_subset_table(
+        self, product_type: str, verbose: bool = True, label_only: bool = False
+    ):
+        """
+        load the subset list for a product type, with local label paths and
+        download URLs. for attached-label types, a label fetched by
+        get_labels(label_only=True) stands in for a file not yet downloaded;
+        if label_only is True, such files are not counted as needed.
+        """
         subset = pd.read_csv(self.subset_list_path(product_type))
         detached = self.rules[product_type]["label"] != "A"
         if detached:
@@ -304,9 +461,19 @@ class IndexMaker(DatasetDefinition):
             lambda fn: Path(self.product_data_path(product_type), fn)
         )
         present = subset["path"].map(lambda path: _casecheck_wrap(path))
+        if not detached:
+            heads = subset["filename"].map(
+                lambda fn: Path(self.label_head_path(product_type), fn)
+            )
+            has_head = ~present & heads.map(lambda path: _casecheck_wrap(path))
+            subset.loc[has_head, "path"] = heads.loc[has_head]
+            if label_only is True:
+                present = present | has_head
         if verbose is True:
             if detached:
                 size_message = "detached labels; "
+            elif label_only is True:
+                size_message = "attached labels; fetching labels only"
             else:
                 size = round(subset.loc[~present]["size"].sum() / 10**9, 1)
                 size_message = f"attached labels; total download ~{size} GB"
@@ -316,20 +483,60 @@ class IndexMaker(DatasetDefinition):
             )
         return subset, subset.loc[~present]
 
-    def write_subset_index(self, product_types: Optional[str]):
+    def write_subset_index(
+        self, product_types: Optional[str], n_workers: Optional[int] = None
+    ):
+        """
+        parse the labels of each product in the subset and write the index.
+        labels are parsed in a pool of n_workers processes (default one per
+        CPU; 1 parses in this process). labels that fail to parse are left
+        out of the index and recorded in the index error file.
+        """
+        if n_workers is None:
+            n_workers = os.cpu_count()
         for product_type in self.expand_product_types(product_types):
             print(f"Writing index for {self.dataset} {product_type}")
             subset, _ = self.load_subset_table(product_type, verbose=False)
-            product_rows = []
-            for ix, product in subset.iterrows():
-                product_row = get_product_row(product["path"], product["url"])
-                print(product_row)
-                product_rows.append(product_row)
+            paths, urls = subset["path"].tolist(), subset["url"].tolist()
+            context = {"dataset": self.dataset, "product_type": product_type}
+            if n_workers > 1 and len(paths) > 1:
+                with ProcessPoolExecutor(
+                    n_workers,
+                    initializer=init_worker_logging,
+                    initargs=(worker_log_queue(), context),
+                ) as pool:
+                    results = list(
+                        pool.map(
+                            try_product_row,
+                            paths,
+                            urls,
+                            chunksize=max(len(paths) // (n_workers * 4), 1),
+                        )
+                    )
+            else:
+                results = list(map(try_product_row, paths, urls))
+            product_rows, errors = [], []
+            with log_context(**context):
+                for path, (product_row, error) in zip(paths, results):
+                    if error is None:
+                        product_rows.append(product_row)
+                        continue
+                    console_and_log(f"couldn't index {path}: {error}", "error")
+                    errors.append({"path": str(path), "error": error})
             # noinspection PyTypeChecker
             pd.DataFrame(product_rows).to_csv(
                 self.index_path(product_type), index=None
             )
-            print(f"Wrote index for {self.dataset} {product_type} subset.")
+            if len(errors) > 0:
+                pd.DataFrame(errors).to_csv(
+                    self.index_error_path(product_type), index=None
+                )
+            else:
+                self.index_error_path(product_type).unlink(missing_ok=True)
+            print(
+                f"Wrote index for {self.dataset} {product_type} subset "
+                f"({len(product_rows)} products, {len(errors)} errors)."
+            )
 
 
 class IndexDownloader(DatasetDefinition):
@@ -356,9 +563,9 @@ class IndexDownloader(DatasetDefinition):
                     shared_index, data_path, add_req_headers
                 )
             if get_test is True:
-                index = pd.read_csv(self.test_path(product_type))
+                index = read_index(self.test_path(product_type))
             else:
-                index = pd.read_csv(self.index_path(product_type))
+                index = read_index(self.index_path(product_type))
             verbose_temp_download(
                 index, data_path, full_lower, add_req_headers, self.skip_files
             )
@@ -374,7 +581,7 @@ class ProductChecker(DatasetDefinition):
     def dump_test_paths(self, product_types):
         result = []
         for product_type in self.expand_product_types(product_types):
-            index = pd.read_csv(self.test_path(product_type))
+            index = read_index(self.test_path(product_type))
             data_path = self.product_data_path(product_type)
             result.append([
                 str(Path(data_path, product["label_file"]))
@@ -393,7 +600,11 @@ class ProductChecker(DatasetDefinition):
         quiet=False,
         max_size=0,
         filetypes=None,
-        skiphash=False
+        skiphash=False,
+        run_id=None,
+        result_dir=None,
+        browse_workers=2,
+        regen_browse=False,
     ):
         """
         generate and / or compare test hashes for a specified mission and
@@ -411,13 +622,24 @@ class ProductChecker(DatasetDefinition):
         dump_browse: if True, also write browse products
 
         dump_kwargs: kwargs for browse writer
+
+        run_id: id under which to add results to the test result store
+        (default: a new id for each product type; see result_utilz)
+
+        result_dir: root of the test result store (default from settings)
+
+        browse_workers: number of threads writing browse products while
+        later products are read; 0 writes them before reading the next one
+
+        regen_browse: if True, rewrite browse products even for products
+        whose data hasn't changed since they were last written
         """
         result = []
         for product_type in self.expand_product_types(product_types):
             self.tracker.set_metadata(product_type=product_type)
             log = partial(console_and_log, quiet=quiet)
             log(f"Hashing {self.dataset} {product_type}.")
-            index = pd.read_csv(self.test_path(product_type))
+            index = read_index(self.test_path(product_type))
             if "hash" not in index.columns:
                 log(f"no hashes found for {product_type}, writing new")
             elif regen is True:
@@ -426,40 +648,74 @@ class ProductChecker(DatasetDefinition):
                 (regen is True) or ("hash" not in index.columns)
             )
             test_args = (
-                compare, pdr_debug, quiet, max_size, filetypes, skiphash, self.tracker
+                compare, pdr_debug, quiet, max_size, filetypes, skiphash, self.tracker,
+                # only hang on to loaded products if we're dumping them
+                dump_browse,
             )
             # compare/overwrite are redundant rn, but presumably we might want
             # different logic in the future.
             overwrite = (regen is True) or ("hash" not in index.columns)
             data_path = self.product_data_path(product_type)
             self.hash_rows, self.log_rows = {}, {}
-            for ix, product in index.iterrows():
-                log(f"testing {product['product_id']}")
-                data, self.hash_rows[ix], self.log_rows[ix] = test_product(
-                    product, Path(data_path, product["label_file"]), *test_args
-                )
-                if (dump_browse is True) and (data is not None):
-                    log(f"dumping browse products for {product['product_id']}")
-                    self.dump_test_browse(data, product_type, dump_kwargs)
-                    log(f"dumped browse products for {product['product_id']}")
+            with BrowseDumper(browse_workers) as dumper:
+                for ix, product in index.iterrows():
+                    log(f"testing {product['product_id']}")
+                    data, self.hash_rows[ix], self.log_rows[ix] = test_product(
+                        product,
+                        Path(data_path, product["label_file"]),
+                        *test_args
+                    )
+                    if (dump_browse is True) and (data is not None):
+                        log(
+                            f"dumping browse products for "
+                            f"{product['product_id']}"
+                        )
+                        # if we didn't hash it (e.g. skiphash=True), let
+                        # dump_test_browse() hash it
+                        hashes = None
+                        if (skiphash is False) and self.hash_rows[ix]:
+                            hashes = json.loads(self.hash_rows[ix])
+                        dumper.submit(
+                            self.dump_test_browse,
+                            data,
+                            product_type,
+                            dump_kwargs,
+                            hashes,
+                            regen_browse,
+                            description=product['product_id'],
+                        )
+                    del data
             if (overwrite is True) and (write is False):
                 log("write=False passed, not updating hashes in csv")
             elif (overwrite is True) and (skiphash is False):
                 index["hash"] = pd.Series(self.hash_rows)
-                index.to_csv(self.test_path(product_type), index=False)
-            result.append(self.write_test_log(product_type))
+                write_index(index, self.test_path(product_type))
+            result.append(
+                self.write_test_log(product_type, run_id, result_dir)
+            )
         return result
 
-    def write_test_log(self, product_type):
+    def write_test_log(self, product_type, run_id=None, result_dir=None):
+        """
+        add this product type's results to the test result store and write
+        them to its latest-log CSV file.
+        """
         log_df = pd.DataFrame.from_dict(self.log_rows, orient="index")
+        write_test_results(
+            log_df,
+            new_run_id() if run_id is None else run_id,
+            self.dataset,
+            product_type,
+            result_dir,
+        )
         log_df["dataset"] = self.dataset
         log_df["product_type"] = product_type
-        timestamp = stamp()[:-2].replace(":", "_").replace("-", "_")
+        if "object_times" in log_df.columns:
+            log_df["object_times"] = [
+                json.dumps(t) if isinstance(t, dict) else None
+                for t in log_df["object_times"]
+            ]
         Path(self.def_path, "logs").mkdir(exist_ok=True)
-        log_df.to_csv(
-            Path(self.def_path, "logs", f"{product_type}_log_{timestamp}.csv"),
-            index=False,
-        )
         log_df.to_csv(
             Path(self.def_path, "logs", f"{product_type}_log_latest.csv"),
             index=False,
@@ -472,7 +728,9 @@ class ProductChecker(DatasetDefinition):
         dump_browse=True,
         dump_kwargs=None,
         pdr_debug=True,
-        nowarn=False
+        nowarn=False,
+        browse_workers=2,
+        regen_browse=False,
     ):
         """
         generate browse products for a specified mission and dataset.
@@ -486,17 +744,39 @@ class ProductChecker(DatasetDefinition):
         pdr_debug: if True, run pdr in debug mode
 
         nowarn: if True, suppress warnings from pdr
+
+        browse_workers: number of threads writing browse products while
+        later products are read; 0 writes them before reading the next one
+
+        regen_browse: if True, rewrite browse products even for products
+        whose data hasn't changed since they were last written
         """
         for product_type in self.expand_product_types(product_types):
             console_and_log(f"Checking {self.dataset} {product_type}.")
-            index = pd.read_csv(self.index_path(product_type))
-            for _, product in index.iterrows():
-                self.check_product(
-                    dump_browse, dump_kwargs, pdr_debug, nowarn, product, product_type
-                )
+            index = read_index(self.index_path(product_type))
+            with BrowseDumper(browse_workers) as dumper:
+                for _, product in index.iterrows():
+                    self.check_product(
+                        dump_browse,
+                        dump_kwargs,
+                        pdr_debug,
+                        nowarn,
+                        product,
+                        product_type,
+                        dumper,
+                        regen_browse,
+                    )
 
     def check_product(
-        self, dump_browse, dump_kwargs, pdr_debug, nowarn, product, product_type
+        self,
+        dump_browse,
+        dump_kwargs,
+        pdr_debug,
+        nowarn,
+        product,
+        product_type,
+        dumper=None,
+        regen_browse=False,
     ):
         console_and_log(f"checking {product['product_id']}")
         path = Path(
@@ -506,18 +786,35 @@ class ProductChecker(DatasetDefinition):
             if nowarn is True:
                 warnings.simplefilter("ignore")
             data = pdr.read(str(path), debug=pdr_debug)
-            data.load("all")
+            # if we're not dumping browse products, don't hold every object
+            load_and_hash(data, skiphash=True, release=not dump_browse)
             console_and_log(f"opened {product['product_id']}")
             if dump_browse:
                 console_and_log(
                     f"dumping browse products for {product['product_id']}"
                 )
-                self.dump_test_browse(data, product_type, dump_kwargs)
-                console_and_log(
-                    f"dumped browse products for {product['product_id']}"
+                if dumper is None:
+                    dumper = BrowseDumper(0)
+                dumper.submit(
+                    self.dump_test_browse,
+                    data,
+                    product_type,
+                    dump_kwargs,
+                    regen=regen_browse,
+                    description=product['product_id'],
                 )
 
-    def dump_test_browse(self, data, product_type, dump_args):
+    def dump_test_browse(
+        self, data, product_type, dump_args, hashes=None, regen=False
+    ):
+        """
+        write browse products for a loaded product, unless the browse
+        products already in the output directory were rendered from data
+        with the same hashes and labels by the same version of pdr using the
+        same dump arguments (or regen is True). hashes are computed with
+        just_hash() if not given. returns False if it skipped writing, True
+        otherwise.
+        """
         kwargs = {} if dump_args is None else dump_args.copy()
         if "outpath" not in kwargs.keys():
             kwargs["outpath"] = self.product_browse_path(product_type)
@@ -526,7 +823,19 @@ class ProductChecker(DatasetDefinition):
             kwargs["purge"] = True
         if "scaled" not in kwargs.keys():
             kwargs["scaled"] = "both"
+        prefix = kwargs.get("prefix", Path(data.filename).stem)
+        if hashes is None:
+            hashes = just_hash(data)
+        tag = browse_tag(hashes, kwargs, unhashed_digests(data))
+        outpath = kwargs["outpath"]
+        if (regen is False) and browse_is_current(outpath, prefix, tag):
+            return False
+        # purge=True empties the Data object as it goes
+        object_names = list(data.keys())
+        clear_browse(outpath, prefix, object_names)
         data.dump_browse(**kwargs)
+        record_browse(outpath, prefix, tag, object_names)
+        return True
 
 
 class CorpusFinalizer(DatasetDefinition):
@@ -541,7 +850,14 @@ class CorpusFinalizer(DatasetDefinition):
         regen=False,
         local=False,
         bucket=None,
+        stratify=False,
+        seed=None,
     ):
+        """
+        write test index files for product types (if they don't exist or
+        regen is True) and upload their products. pass seed for
+        reproducible subsets.
+        """
         from hostess.aws.s3 import Bucket
         if local:
             bucket = None
@@ -554,18 +870,32 @@ class CorpusFinalizer(DatasetDefinition):
 
         for product_type in self.expand_product_types(product_types):
             if regen or not self.test_path(product_type).is_file():
-                self.create_test_subset_csv(product_type, product, subset_size)
+                self.create_test_subset_csv(
+                    product_type, product, subset_size, stratify, seed
+                )
             if bucket is not None:
                 self.upload_to_s3(product_type, bucket)
 
-    def create_test_subset_csv(self, product_type, product, subset_size):
+    def create_test_subset_csv(
+        self, product_type, product, subset_size, stratify=False, seed=None
+    ):
+        rng = np.random.default_rng(seed)
         with (
             open(self.index_path(product_type)) as index_f,
             open(self.test_path(product_type), 'w+') as test_f
         ):
-            if not product:  # TODO: what is the actual 'falsy' case here
+            if not product and stratify:
+                # line numbers; line 0 is the header
+                picks = self.stratified_index_picks(
+                    product_type, subset_size, rng
+                )
+                chosen = set((picks + 1).tolist())
+                for pos, line in enumerate(index_f):
+                    if pos == 0 or pos in chosen:
+                        test_f.write(line)
+            elif not product:  # TODO: what is the actual 'falsy' case here
                 index_length = sum(1 for _ in index_f)
-                integer_choice = np.random.choice(
+                integer_choice = rng.choice(
                     np.arange(1, index_length), size=subset_size
                 )
                 index_f.seek(0)
@@ -585,34 +915,68 @@ class CorpusFinalizer(DatasetDefinition):
                         f'regen=True.'
                     )
 
+    def stratified_index_picks(
+        self,
+        product_type: str,
+        subset_size: int,
+        rng: Optional[np.random.Generator] = None,
+    ):
+        """
+        stratified_pick() over the rows of a product type's index. volumes
+        come from the subset list; sizes from the local copies of each
+        product's files; formats from the extensions of those files. pass
+        a seeded rng for reproducible picks.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        index = read_index(self.index_path(product_type))
+        files = index["files"]
+        data_path = self.product_data_path(product_type)
+        volumes = {}
+        if self.subset_list_path(product_type).exists():
+            subset = pd.read_csv(self.subset_list_path(product_type))
+            if "volume" in subset.columns:
+                url_stems = "http://" + subset["domain"] + "/" + subset["url"]
+                volumes = dict(zip(url_stems, subset["volume"]))
+
+        def local_size(fns):
+            paths = [Path(data_path, fn) for fn in fns]
+            return sum(p.stat().st_size for p in paths if p.exists())
+
+        strata = pd.DataFrame(
+            {
+                "volume": index["url_stem"].map(volumes),
+                "directory": directory_layout(index["url_stem"]),
+                "size": files.map(local_size),
+                "format": files.map(
+                    lambda fns: " ".join(
+                        sorted({Path(fn).suffix.lower() for fn in fns})
+                    )
+                ),
+            }
+        )
+        return stratified_pick(strata, subset_size, rng)
+
     def upload_to_s3(self, product_type, corpus):
-        with open(self.test_path(product_type)) as test_f:
-            next(test_f)
-            for line in test_f:
-                file_list = (
-                    line.replace(']', '[')
-                    .split('[')[1]
-                    .replace('"', '')
-                    .split(',')
-                )
-                for file in file_list:
-                    try:
-                        file = file.split('/')[-1].strip()
-                        corpus.put(
-                            Path(
-                                self.product_data_path(product_type), file),
-                                f'{self.dataset}/{product_type}/{file}'
-                            )
-                        print(
-                            f'{self.dataset} {product_type}: {file} '
-                            f'uploaded to s3.'
-                        )
-                    except FileNotFoundError:
-                        print(
-                            f'{file} not present in subset folder. '
-                            f'Please put it in data/{self.dataset}/'
-                            f'{product_type} and retry.'
+        for file_list in read_index(self.test_path(product_type))["files"]:
+            for file in file_list:
+                try:
+                    file = file.split('/')[-1].strip()
+                    corpus.put(
+                        Path(
+                            self.product_data_path(product_type), file),
+                            f'{self.dataset}/{product_type}/{file}'
                         )
+                    print(
+                        f'{self.dataset} {product_type}: {file} '
+                        f'uploaded to s3.'
+                    )
+                except FileNotFoundError:
+                    print(
+                        f'{file} not present in subset folder. '
+                        f'Please put it in data/{self.dataset}/'
+                        f'{product_type} and retry.'
+                    )
 
 
 # ############## STANDALONE / HANDLER FUNCTIONS ###############
@@ -626,11 +990,13 @@ def test_product(
     max_size: float = 0,
     filetypes: Optional[Sequence[str]] = None,
     skiphash: bool = False,
-    tracker: Optional[Tracker] = None
+    tracker: Optional[Tracker] = None,
+    keep_data: bool = True,
 ) -> tuple[Optional[Data], str, dict]:
     """
     handler function for testing an individual product: records exceptions
-    and (when instructed) hash/index comparisons.
+    and (when instructed) hash/index comparisons. returns the loaded Data
+    object only if keep_data is True.
     """
     data, hash_json = None, ""
     log_row = {
@@ -649,15 +1015,12 @@ def test_product(
         return data, hash_json, log_row
     try:
         data, hashes, runtimes = read_and_hash(
-            path, product, pdr_debug, quiet, skiphash, tracker
+            path, product, pdr_debug, quiet, skiphash, tracker, keep_data
         )
         if (skiphash is False) and (compare is True):
-            if isinstance(product["hash"], float):
-                if np.isnan(product["hash"]):
-                    raise MissingHashError
-            log_row = record_comparison(
-                hashes, json.loads(product["hash"]), log_row
-            )
+            if product["hash"] is None:
+                raise MissingHashError
+            log_row = record_comparison(hashes, product["hash"], log_row)
         hash_json = json.dumps(hashes)
         log_row |= runtimes
     except MissingHashError:
@@ -696,7 +1059,7 @@ def check_exclusions(filetypes, log_row, max_size, product, path):
         return False, log_row
     checkmap = [
         path_if_found(Path(path.parent, file))
-        for file in json.loads(product['files'])
+        for file in product['files']
     ]
     present_files = list(filter(None, checkmap))
     if len(present_files) == 0:
@@ -742,9 +1105,7 @@ def directory_to_index(
 
 def pluck_row_from_manifest(file, manifest, product_rows, filters):
     """inner row constructor for index_directory"""
-    match = parquet.read_table(
-        manifest, filters=[("filename", "=", file.name)]
-    )
+    match = read_manifest(manifest, filters=[("filename", "=", file.name)])
     assert len(match) >= 1, f"{file.name} not found in manifest"
     if len(match) > 1:
         warnings.warn(
@@ -2,6 +2,49 @@
 
 import importlib as _importlib
 from collections.abc import Mapping as _Mapping
+import os as _os
+from pathlib import Path as _Path
+import pickle as _pickle
+import tempfile as _tempfile
+
+# attributes of selection_rules modules that are kept in the rules registry.
+# reading any other attribute of a registry entry imports the module.
+_SNAPSHOT_ATTRS = ("file_information", "SKIP_FILES")
+
+
+class _RulesSnapshot:
+    """
+    Stands in for a `selection_rules` module whose `file_information` (and
+    `SKIP_FILES`, if it has one) were loaded from the rules registry rather
+    than by importing it. Any other attribute access imports the module and
+    returns the module's attribute.
+    """
+    def __init__(self, name, attrs):
+        self.__name__ = f"{__name__}.{name}.selection_rules"
+        self.__package__ = f"{__name__}.{name}"
+        self.__dict__.update(attrs)
+
+    def __getattr__(self, attr):
+        # only called for attributes not in the snapshot
+        if attr in _SNAPSHOT_ATTRS:
+            # the module doesn't define it either
+            raise AttributeError(attr)
+        return getattr(_importlib.import_module(self.__name__), attr)
+
+    def __repr__(self):
+        return f"<selection rules {self.__name__!r} (from registry)>"
+
+
+def _rules_stat(name):
+    """
+    (mtime, size) of the selection_rules.py for `name`; raises
+    ModuleNotFoundError if there isn't one.
+    """
+    try:
+        stat = (_Path(__file__).parent / name / "selection_rules.py").stat()
+    except (FileNotFoundError, NotADirectoryError) as e:
+        raise ModuleNotFoundError(f"no selection rules for {name}") from e
+    return stat.st_mtime_ns, stat.st_size
 
 
 class _RulesModulesMap(_Mapping):
@@ -13,10 +56,19 @@ class _RulesModulesMap(_Mapping):
     This singleton acts like a read-only dictionary { name: module } where
     module is the `selection_rules` module corresponding to `name` (not
     the `file_information` object).
+
+    To avoid importing ~200 modules every time something iterates over all
+    rules, `file_information` and `SKIP_FILES` from each module are cached
+    in a registry file (settings.rules_registry_path), keyed by the mtime
+    and size of each selection_rules.py. Rules modules whose registry entry
+    is current are returned as _RulesSnapshot objects instead of modules.
+    Stale entries are refreshed the next time all rules are loaded.
     """
     def __init__(self):
         self._rules_modules = {}
         self._scan_complete = False
+        self._registry = None
+        self._registry_dirty = False
 
     def __getitem__(self, key):
         try:
@@ -32,17 +84,55 @@ class _RulesModulesMap(_Mapping):
         self._ensure_all_loaded()
         return len(self._rules_modules)
 
+    def _registry_path(self):
+        from pdr_tests.settings import SETTINGS
+
+        return SETTINGS.rules_registry_path
+
+    def _load_registry(self):
+        """{name: ((mtime, size), pickled snapshot attrs or None)}"""
+        if self._registry is None:
+            try:
+                with open(self._registry_path(), "rb") as stream:
+                    self._registry = _pickle.load(stream)
+            except (OSError, _pickle.UnpicklingError, EOFError):
+                self._registry = {}
+        return self._registry
+
+    def _write_registry(self):
+        path = self._registry_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write-then-rename, so concurrent readers never see partial files
+            tempfd, temp_name = _tempfile.mkstemp(
+                dir=path.parent, suffix=".part"
+            )
+            with _os.fdopen(tempfd, "wb") as stream:
+                _pickle.dump(self._registry, stream)
+            _os.replace(temp_name, path)
+        except OSError:
+            # e.g. read-only install; modules will just be imported again
+            return
+        self._registry_dirty = False
+
     def _ensure_all_loaded(self):
         if self._scan_complete:
             return
 
-        for subdir in _importlib.resources.files(__name__).iterdir():
-            if subdir.name in ("__cache__", "__init__.py"):
+        for subdir in sorted(_Path(__file__).parent.iterdir()):
+            if not (subdir / "selection_rules.py").exists():
                 continue
             try:
                 self._load_rules_mod(subdir.name)
             except (AttributeError, ModuleNotFoundError):
                 pass
+        registry = self._load_registry()
+        # forget rules modules that have been deleted
+        for name in set(registry).difference(self._rules_modules):
+            del registry[name]
+            self._registry_dirty = True
+        if self._registry_dirty:
+            self._write_registry()
 
         self._scan_complete = True
 
@@ -52,12 +142,31 @@ class _RulesModulesMap(_Mapping):
         except KeyError:
             pass
 
+        stat = _rules_stat(name)
+        registry = self._load_registry()
+        if (entry := registry.get(name)) is not None and entry[0] == stat:
+            if entry[1] is not None:
+                mod = _RulesSnapshot(name, _pickle.loads(entry[1]))
+                self._rules_modules[name] = mod
+                return mod
         mod = _importlib.import_module(
             f".{name}.selection_rules",
             __name__,
         )
         getattr(mod, "file_information")
         self._rules_modules[name] = mod
+        attrs = {
+            attr: getattr(mod, attr)
+            for attr in _SNAPSHOT_ATTRS if hasattr(mod, attr)
+        }
+        try:
+            snapshot = _pickle.dumps(attrs)
+        except (_pickle.PicklingError, TypeError, AttributeError):
+            # depends on something that can't be pickled; always import it
+            snapshot = None
+        if registry.get(name) != (stat, snapshot):
+            registry[name] = (stat, snapshot)
+            self._registry_dirty = True
         return mod
 
 
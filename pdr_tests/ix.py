@@ -7,14 +7,24 @@ For details of each action use 'ix <action> --help'.
 
 import sys
 
-from pdr_tests import ix_interface
-from pdr_tests.utilz.ix_utilz import console_and_log
+from pdr_tests.settings import SETTINGS
 from pdr_tests.utilz.cli_utilz import CLIDispatcher
+from pdr_tests.utilz.serve_utilz import run_on_daemon
+
+
+def make_dispatcher() -> CLIDispatcher:
+    from pdr_tests import ix_interface
+
+    return CLIDispatcher(__doc__, ix_interface)
 
 
 def cli_main():
-    cli = CLIDispatcher(__doc__, ix_interface)
-    cli.parse_args().run()
+    # if an 'ix serve' daemon is running, let it answer the actions it can,
+    # without importing pdr, pandas, etc. here.
+    code = run_on_daemon(sys.argv[1:], SETTINGS.serve_socket)
+    if code is not None:
+        return code
+    make_dispatcher().parse_args().run()
 
 
 if __name__ == "__main__":
@@ -1,26 +1,17 @@
 from ast import literal_eval
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Optional
 
-from pdr_tests.datasets import (
-    ProductPicker,
-    IndexMaker,
-    IndexDownloader,
-    ProductChecker,
-    CorpusFinalizer,
-    directory_to_index,
-    MissingHashError,
-)
+# pdr_tests.datasets and pdr_tests.utilz.ix_utilz import pdr, pandas,
+# pyarrow, boto3, etc., which takes seconds. import them (and anything else
+# that imports them) inside the actions that need them, not here, so that
+# 'ix --help', 'ix ls' and the like start quickly. see
+# pdr_tests.utilz.dev_utilz.ix_import_benchmark().
 from pdr_tests.definitions import RULES_MODULES
 from pdr_tests.settings import SETTINGS
 from pdr_tests.utilz.cli_utilz import cli_action
-from pdr_tests.utilz.ix_utilz import (
-    clean_logs,
-    console_and_log,
-    download_datasets,
-    list_datasets,
-    print_rules_list, find_product,
-)
+from pdr_tests.utilz.rules_utilz import list_datasets, print_rules_list
 
 
 def validate_dataset(ds: str) -> str:
@@ -68,6 +59,15 @@ cli_action.add_common_argspecs(
     tracker_log_dir = {
         "help": "Directory to store tracker logs in",
     },
+    test_result_dir = {
+        "help": "Root of the Parquet dataset of 'ix test' results",
+    },
+    filename_table_path = {
+        "help": "Path to filename parquet table used by 'ix find'",
+    },
+    serve_socket = {
+        "help": "Unix socket for the 'ix serve' daemon",
+    },
     headers = {
         "help": (
             "Additional HTTP request headers to send when downloading files"
@@ -92,6 +92,12 @@ cli_action.add_common_argspecs(
         "short": "q",
         "help": "Print only errors",
     },
+    stratify = {
+        "help": (
+            "Spread the subset across volumes, directory layouts and file"
+            " sizes rather than choosing uniformly at random"
+        ),
+    },
     subset_size = {
         "short": "s",
         "help": (
@@ -106,6 +112,9 @@ cli_action.add_common_argspecs(
             " (default: 8 GB)"
         ),
     },
+    seed = {
+        "help": "Seed for the random number generator, for repeatable picks",
+    },
     dump_browse = {
         "short": "d",
         "help": "Generate readable 'browse products' for each product",
@@ -118,6 +127,18 @@ cli_action.add_common_argspecs(
             " (expects a Python dictionary literal)"
         ),
     },
+    browse_workers = {
+        "help": (
+            "Number of threads writing browse products while later products"
+            " are read (0: write them before reading the next product)"
+        ),
+    },
+    regen_browse = {
+        "help": (
+            "Rewrite browse products even for products whose data hasn't"
+            " changed since they were last written"
+        ),
+    },
 )
 
 
@@ -133,6 +154,8 @@ def sort(
     """
     Filter a manifest down to a single data set, using selection rules.
     """
+    from pdr_tests.datasets import ProductPicker
+
     if manifest_dir is None:
         manifest_dir = SETTINGS.manifest_dir
     if data_root is None:
@@ -150,18 +173,22 @@ def pick(
     *,
     subset_size: int = 200,
     max_size: int = 8000,
+    seed: Optional[int] = None,
+    stratify: bool = False,
     data_root: Optional[Path] = None,
     browse_root: Optional[Path] = None,
 ):
     """
     Choose a random subset of a data set for manual systematic testing.
     """
+    from pdr_tests.datasets import ProductPicker
+
     if data_root is None:
         data_root = SETTINGS.data_root
     if browse_root is None:
         browse_root = SETTINGS.browse_root
     picker = ProductPicker(dataset, data_root, browse_root)
-    picker.random_picks(product_type, subset_size, max_size)
+    picker.random_picks(product_type, subset_size, max_size, seed, stratify)
 
 
 @cli_action(
@@ -169,12 +196,27 @@ def pick(
         "short": "d",
         "help": "Do not actually download any labels"
     },
+    label_only = {
+        "help": (
+            "For attached-label products, fetch only the label at the start"
+            " of each file instead of the whole file"
+        ),
+    },
+    n_workers = {
+        "short": "n",
+        "help": (
+            "Number of processes to parse labels with"
+            " (default: one per CPU)"
+        ),
+    },
 )
 def index(
     dataset: str,
     product_type: Optional[str] = None,
     *,
     dry_run: bool = False,
+    label_only: bool = False,
+    n_workers: Optional[int] = None,
     data_root: Optional[Path] = None,
     browse_root: Optional[Path] = None,
     headers: Optional[str] = None,
@@ -183,6 +225,8 @@ def index(
     Download detached labels and create a comprehensive index for the
     products selected by 'ix pick'.
     """
+    from pdr_tests.datasets import IndexMaker
+
     if data_root is None:
         data_root = SETTINGS.data_root
     if browse_root is None:
@@ -192,10 +236,12 @@ def index(
     else:
         headers = literal_eval(headers)
     indexer = IndexMaker(dataset, data_root, browse_root)
-    indexer.get_labels(product_type, dry_run, add_req_headers=headers)
+    indexer.get_labels(
+        product_type, dry_run, add_req_headers=headers, label_only=label_only
+    )
     if dry_run:
         return
-    indexer.write_subset_index(product_type)
+    indexer.write_subset_index(product_type, n_workers)
 
 
 @cli_action(
@@ -221,6 +267,8 @@ def download(
     """
     Download all of the indexed products for a data set.
     """
+    from pdr_tests.datasets import IndexDownloader
+
     if dataset is None:
         if get_test is False:
             raise ValueError(
@@ -259,6 +307,8 @@ def check(
     warn: bool = True,
     dump_browse: bool = True,
     dump_kwargs: Optional[str] = None,
+    browse_workers: int = 2,
+    regen_browse: bool = False,
     data_root: Optional[Path] = None,
     browse_root: Optional[Path] = None,
     tracker_log_dir: Optional[Path] = None,
@@ -266,6 +316,9 @@ def check(
     """
     Attempt to use PDR to read every indexed product in a data set.
     """
+    from pdr_tests.datasets import ProductChecker
+    from pdr_tests.utilz.ix_utilz import log_context
+
     if data_root is None:
         data_root = SETTINGS.data_root
     if browse_root is None:
@@ -275,9 +328,16 @@ def check(
     if dump_kwargs is not None:
         dump_kwargs = literal_eval(dump_kwargs)
     hasher = ProductChecker(dataset, data_root, browse_root, tracker_log_dir)
-    hasher.check_product_type(
-        product_type, dump_browse, dump_kwargs, pdr_debug, not warn
-    )
+    with log_context(dataset=dataset):
+        hasher.check_product_type(
+            product_type,
+            dump_browse,
+            dump_kwargs,
+            pdr_debug,
+            not warn,
+            browse_workers,
+            regen_browse,
+        )
 
 
 @cli_action(
@@ -300,6 +360,12 @@ def check(
     filetypes = {
         "help": "Space-separated list of file extensions to process",
     },
+    label_cache = {
+        "help": (
+            "Read PDS3 labels through the parsed-label cache (makes"
+            " recorded read times incomparable with uncached runs)"
+        ),
+    },
 )
 def test(
     dataset: Optional[str] = None,
@@ -312,21 +378,33 @@ def test(
     pdr_debug: bool = True,
     quiet: bool = False,
     skip_hash: bool = False,
+    label_cache: bool = False,
     dump_browse: bool = False,
     dump_kwargs: Optional[str] = None,
+    browse_workers: int = 2,
+    regen_browse: bool = False,
     data_root: Optional[Path] = None,
     browse_root: Optional[Path] = None,
     tracker_log_dir: Optional[Path] = None,
+    test_result_dir: Optional[Path] = None,
 ):
     """
     Generate and/or compare test hashes for a data set (or all data sets).
+    Results are added to the test result store under a new run id.
     """
+    from pdr_tests.datasets import MissingHashError, ProductChecker
+    from pdr_tests.utilz.ix_utilz import console_and_log, log_context
+    from pdr_tests.utilz.label_utilz import cached_labels
+    from pdr_tests.utilz.result_utilz import new_run_id
+
     if data_root is None:
         data_root = SETTINGS.data_root
     if browse_root is None:
         browse_root = SETTINGS.browse_root
     if tracker_log_dir is None:
         tracker_log_dir = SETTINGS.tracker_log_dir
+    if test_result_dir is None:
+        test_result_dir = SETTINGS.test_result_dir
     if len(filetypes) > 0:
         filetypes = {f.lower().strip(".") for f in filetypes.split(" ")}
     if dump_kwargs is not None:
@@ -336,24 +414,31 @@ def test(
         datasets = list_datasets()
     else:
         datasets = [dataset]
-    logs = []
+    logs, run_id = [], new_run_id()
+    print(f"test run id: {run_id}")
     for dataset in datasets:
         hasher = ProductChecker(dataset, data_root, browse_root,
                                 tracker_log_dir)
         hasher.tracker.paused = True
         try:
-            test_logs = hasher.compare_test_hashes(
-                product_type,
-                regen,
-                write,
-                pdr_debug,
-                dump_browse,
-                dump_kwargs,
-                quiet,
-                max_size,
-                filetypes,
-                skip_hash
-            )
+            cache_context = cached_labels() if label_cache else nullcontext()
+            with cache_context, log_context(dataset=dataset):
+                test_logs = hasher.compare_test_hashes(
+                    product_type,
+                    regen,
+                    write,
+                    pdr_debug,
+                    dump_browse,
+                    dump_kwargs,
+                    quiet,
+                    max_size,
+                    filetypes,
+                    skip_hash,
+                    run_id,
+                    test_result_dir,
+                    browse_workers,
+                    regen_browse,
+                )
             logs += test_logs
         except MissingHashError:
             return
@@ -386,6 +471,8 @@ def test_paths(
     """
     Print the names of the test inputs for a data set (or all data sets).
     """
+    from pdr_tests.datasets import ProductChecker
+
     if data_root is None:
         data_root = SETTINGS.data_root
     if browse_root is None:
@@ -430,11 +517,15 @@ def finalize(
     regen: bool = False,
     local: bool = False,
     subset_size: int = 1,
+    stratify: bool = False,
+    seed: Optional[int] = None,
     bucket: Optional[str] = None,
     data_root: Optional[Path] = None,
     browse_root: Optional[Path] = None,
 ):
     """Create a test subset (if necessary) and upload relevant test files to S3."""
+    from pdr_tests.datasets import CorpusFinalizer
+
     if bucket is None:
         bucket = SETTINGS.test_corpus_bucket
     if bucket is None:
@@ -454,7 +545,14 @@ def finalize(
 
     finalizer = CorpusFinalizer(dataset, data_root, browse_root)
     finalizer.create_and_upload_test_subset(
-        product_type, product, subset_size, regen, local, bucket,
+        product_type,
+        product,
+        subset_size,
+        regen,
+        local,
+        bucket,
+        stratify,
+        seed,
     )
 
 
@@ -485,6 +583,8 @@ def index_directory(
     filters: Optional[str] = None,
 ):
     """Create an index file for the contents of a specific directory."""
+    from pdr_tests.datasets import directory_to_index
+
     if filters is not None:
         filters = literal_eval(filters)
     directory_to_index(target, manifest, output, stop_on_first_error, filters)
@@ -538,6 +638,8 @@ def sync(
     """
     Download test files from an S3 bucket.
     """
+    from pdr_tests.utilz.ix_utilz import download_datasets
+
     if bucket is None:
         bucket = SETTINGS.test_corpus_bucket
     if bucket is None:
@@ -576,27 +678,110 @@ def clean():
     """
     Erase most pdr-tests log files.
     """
+    from pdr_tests.utilz.ix_utilz import clean_logs
+
     clean_logs()
 
 
 @cli_action(
     pid={"help": "Filename or product ID to find"},
-    filename_table_path={"help": "path to filename parquet table"}
+    from_file={
+        "short": "f",
+        "help": "Text file of filenames or product IDs to find, one per line",
+    },
+    output={
+        "short": "o",
+        "help": (
+            "Write id/URL pairs to this .csv or .parquet file rather than"
+            " printing them"
+        ),
+    },
 )
 def find(
-    pid: str,
+    pid: Optional[str] = None,
     *,
+    from_file: Optional[Path] = None,
+    output: Optional[Path] = None,
     manifest_dir: Optional[Path] = None,
     filename_table_path: Optional[Path] = None
 ):
+    """
+    Find URLs for a filename or product ID, or for every filename or product
+    ID listed in a file.
+    """
+    from pdr_tests.utilz.ix_utilz import (
+        find_product, find_products, write_found_products
+    )
+
     if manifest_dir is None:
         manifest_dir = SETTINGS.manifest_dir
     if filename_table_path is None:
         filename_table_path = SETTINGS.filename_table_path
+    if (pid is None) == (from_file is None):
+        raise ValueError("Specify exactly one of pid or --from-file.")
+    if from_file is None and output is None:
+        try:
+            urls = find_product(filename_table_path, manifest_dir, pid)
+            for url in urls:
+                print(url)
+        except FileNotFoundError as fnf:
+            print(fnf)
+        return
+    if from_file is not None:
+        pids = [
+            line.strip() for line in from_file.read_text().splitlines()
+            if line.strip() != ""
+        ]
+    else:
+        pids = [pid]
     try:
-        urls = find_product(filename_table_path, manifest_dir, pid)
-        for url in urls:
-            print(url)
+        found = find_products(filename_table_path, manifest_dir, pids)
     except FileNotFoundError as fnf:
         print(fnf)
+        return
+    write_found_products(found, output)
+
+
+@cli_action(
+    n_shards = {
+        "short": "n",
+        "help": "Number of shards to split the index into (default: 16)",
+    },
+    rebuild = {
+        "short": "r",
+        "help": "Rebuild the index from scratch rather than refreshing it",
+    },
+)
+def build_find_index(
+    *,
+    n_shards: int = 16,
+    rebuild: bool = False,
+    manifest_dir: Optional[Path] = None,
+    filename_table_path: Optional[Path] = None,
+):
+    """
+    Build or refresh the filename table used by 'ix find' from all manifests
+    in the manifest directory. Only new or changed manifests are reindexed.
+    """
+    from pdr_tests.utilz.ix_utilz import write_find_index
+
+    if manifest_dir is None:
+        manifest_dir = SETTINGS.manifest_dir
+    if filename_table_path is None:
+        filename_table_path = SETTINGS.filename_table_path
+    write_find_index(manifest_dir, filename_table_path, n_shards, rebuild)
+
+
+@cli_action
+def serve(*, serve_socket: Optional[Path] = None):
+    """
+    Run a local daemon that answers 'ix find' and 'ix ls' requests without
+    restarting Python each time. Other ix invocations use it automatically
+    while it is running, and run in-process when it is not.
+    """
+    from pdr_tests.ix import make_dispatcher
+    from pdr_tests.utilz.serve_utilz import serve as serve_actions
 
+    if serve_socket is None:
+        serve_socket = SETTINGS.serve_socket
+    serve_actions(serve_socket, make_dispatcher())
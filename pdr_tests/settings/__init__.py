@@ -215,6 +215,24 @@ class IxSettings:
     #: Directory to write tracker logs to.
     tracker_log_dir: Path = "$PDR_TESTS_ROOT/.tracker_logs"
 
+    #: Root of the Parquet dataset of 'ix test' results.
+    test_result_dir: Path = "$PDR_TESTS_ROOT/test_results"
+
+    #: Directory for the cache of parsed PDS3 labels used by
+    #: 'ix index', scan_headers and 'ix test --label-cache'.
+    label_cache_dir: Path = "$PDR_TESTS_ROOT/.label_cache"
+
+    #: Directory for parsed copies of index and test index CSV files.
+    index_cache_dir: Path = "$PDR_TESTS_ROOT/.index_cache"
+
+    #: Cache of selection rules from pdr_tests/definitions, so that
+    #: listing all data sets does not import every rules module.
+    rules_registry_path: Path = "$PDR_TESTS_ROOT/.rules_registry.pickle"
+
+    #: Unix socket used by 'ix serve', and by other ix actions to
+    #: find a running 'ix serve' daemon.
+    serve_socket: Path = "$PDR_TESTS_ROOT/.ix_serve.sock"
+
     #: S3 bucket holding the complete test corpus.
     #: Currently used only by 'ix finalize'.
     test_corpus_bucket: Optional[str] = None
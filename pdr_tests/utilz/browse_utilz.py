@@ -0,0 +1,217 @@
+"""
+writing browse products in the background. ix test --dump-browse and ix
+check hand each loaded Data object to a BrowseDumper, which encodes and
+writes its browse products in a small thread pool while the next product
+is read and hashed. most of the work (PIL's PNG encoder, numpy scaling,
+CSV writing) releases the GIL, so threads overlap well and loaded Data
+objects don't need to be pickled.
+
+browse products are also written incrementally: each product's browse
+products are recorded in a hidden JSON file in their output directory,
+tagged with the hashes of the data they were rendered from (see
+ix_utilz.just_hash), digests of the loaded objects just_hash() skips
+(labels, text), the pdr version (which determines scaling and masking)
+and the arguments to Data.dump_browse. if the tag hasn't changed, the
+product's browse products are left as they are.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextvars
+import glob
+from hashlib import md5
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Callable, Collection, Mapping, Optional, Union
+
+import pdr
+
+from pdr_tests.utilz.ix_utilz import console_and_log, is_hashed
+
+# dump_browse arguments that don't affect the content of browse products
+UNTAGGED_DUMP_KWARGS = ("outpath", "purge")
+
+
+def unhashed_digests(data) -> dict[str, str]:
+    """
+    digests of the loaded objects of a Data object that just_hash() skips
+    (labels, text, PVL blocks other than FITS headers). dump_browse() still
+    writes these, and they control how the hashed objects are scaled.
+    """
+    digests = {}
+    for key in data.keys():
+        if (key not in dir(data)) or is_hashed(data, key):
+            continue
+        obj = data[key]
+        # pds4_tools label objects have no informative repr
+        text = obj.to_string() if hasattr(obj, "to_string") else repr(obj)
+        digests[key] = md5(text.encode(), usedforsecurity=False).hexdigest()
+    return digests
+
+
+def browse_tag(
+    hashes: Mapping[str, str],
+    dump_kwargs: Mapping,
+    digests: Optional[Mapping[str, str]] = None,
+) -> str:
+    """
+    digest of a product's data hashes, the digests of its unhashed objects,
+    the pdr version and the arguments used to dump it
+    """
+    kwargs = {
+        k: v for k, v in dump_kwargs.items() if k not in UNTAGGED_DUMP_KWARGS
+    }
+    content = [hashes, digests or {}, pdr.__version__, kwargs]
+    return md5(
+        json.dumps(content, sort_keys=True, default=repr).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+
+
+def browse_record_path(outpath: Union[str, Path], prefix: str) -> Path:
+    return Path(outpath, f".{prefix}.browse.json")
+
+
+def read_browse_record(outpath: Union[str, Path], prefix: str) -> dict:
+    """{'tag': browse_tag(), 'files': [file names]}, or {} if not found"""
+    try:
+        return json.loads(browse_record_path(outpath, prefix).read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def browse_is_current(
+    outpath: Union[str, Path], prefix: str, tag: str
+) -> bool:
+    record = read_browse_record(outpath, prefix)
+    if record.get("tag") != tag:
+        return False
+    return all(Path(outpath, name).exists() for name in record["files"])
+
+
+def browse_files(
+    outpath: Union[str, Path], prefix: str, object_names: Collection[str]
+) -> set[str]:
+    """
+    names of files in outpath that Data.dump_browse() may have written for
+    a product whose objects are named object_names
+    """
+    files = set()
+    for name in object_names:
+        pattern = glob.escape(f"{prefix}_{name}") + "*"
+        files.update(p.name for p in Path(outpath).glob(pattern))
+    return files
+
+
+def clear_browse(
+    outpath: Union[str, Path], prefix: str, object_names: Collection[str]
+):
+    """
+    delete a product's browse products -- both the files its record lists
+    and any others that look like they belong to it, such as files left
+    behind by a dump that failed partway -- and then its record.
+    """
+    record = read_browse_record(outpath, prefix)
+    stale = set(record.get("files", []))
+    stale.update(browse_files(outpath, prefix, object_names))
+    for name in stale:
+        Path(outpath, name).unlink(missing_ok=True)
+    browse_record_path(outpath, prefix).unlink(missing_ok=True)
+
+
+def record_browse(
+    outpath: Union[str, Path],
+    prefix: str,
+    tag: str,
+    object_names: Collection[str],
+):
+    """
+    record the browse products Data.dump_browse() wrote for a product whose
+    objects are named object_names. call only after a successful dump. the
+    record is written to a temporary file and then moved into place, so an
+    interrupted write never leaves a partial record.
+    """
+    files = browse_files(outpath, prefix, object_names)
+    path = browse_record_path(outpath, prefix)
+    temp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    temp.write_text(json.dumps({"tag": tag, "files": sorted(files)}))
+    os.replace(temp, path)
+
+
+class BrowseDumper:
+    """
+    runs browse dumps in a pool of n_workers threads. submit() blocks while
+    max_pending dumps are already queued or running, which caps the number
+    of loaded products held in memory at once. if n_workers is 0, dumps run
+    synchronously in submit(). a dump function may return False to indicate
+    that it skipped writing anything.
+
+    exceptions raised by dumps are logged as they happen; close() (or
+    leaving a `with` block) waits for outstanding dumps and then re-raises
+    the first of them.
+    """
+
+    def __init__(self, n_workers: int = 2, max_pending: Optional[int] = None):
+        self.n_workers = n_workers
+        if max_pending is None:
+            max_pending = 2 * n_workers
+        self.executor = None
+        if n_workers > 0:
+            self.executor = ThreadPoolExecutor(
+                n_workers, thread_name_prefix="browse"
+            )
+            self.slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self.errors = []
+
+    def submit(self, func: Callable, *args, description: str = "", **kwargs):
+        if self.executor is None:
+            wrote = func(*args, **kwargs)
+            console_and_log(self._success_message(wrote, description))
+            return
+        self.slots.acquire()
+        # carry log_context() fields over to the worker thread
+        context = contextvars.copy_context()
+        try:
+            future = self.executor.submit(context.run, func, *args, **kwargs)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(
+            lambda f: self._finish(f, description, context)
+        )
+
+    def _finish(self, future: Future, description: str, context):
+        self.slots.release()
+        if future.cancelled():
+            return
+        if (ex := future.exception()) is None:
+            message = self._success_message(future.result(), description)
+        else:
+            self.errors.append(ex)
+            message = (
+                f"failed to dump browse products for {description}: "
+                f"{type(ex)}: {ex}"
+            )
+        context.run(console_and_log, message)
+
+    @staticmethod
+    def _success_message(wrote, description):
+        if wrote is False:
+            return f"browse products for {description} unchanged, skipped"
+        return f"dumped browse products for {description}"
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if len(self.errors) > 0:
+            raise self.errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self.executor is not None:
+            # don't start dumps that haven't started yet
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            return
+        self.close()
@@ -1,7 +1,6 @@
 import shutil
-from collections import defaultdict
 from functools import reduce
-from typing import Optional
+from typing import Iterator, Optional, Union
 
 import pandas as pd
 import pyarrow as pa
@@ -12,6 +11,7 @@ from pyarrow import parquet
 from pathlib import Path
 
 from pdr_tests.definitions import RULES_MODULES
+from pdr_tests.utilz.manifest_utilz import iter_manifest_batches
 
 
 # defining these separately from the 'special' label search
@@ -36,6 +36,19 @@ LABEL_EXTENSIONS = ("fmt", "lbl", "xml")
 IGNORE_DIRECTORIES = (
     "calib", "geometry", "document", "index", "catalog", "browse", "extras"
 )
+# columns of coverage manifests used by coverage metrics
+COUNT_COLUMNS = (
+    "url",
+    "filename",
+    "dataset_ix",
+    "dataset_pds",
+    "volume",
+    "ptype",
+    "size",
+    "label",
+)
+# number of manifest rows tallied at once by count_coverage()
+COUNT_BATCH_SIZE = 100000
 
 
 def add_coverage_column(manifest_dir, fn):
@@ -202,17 +215,44 @@ def add_rule_labels(relevant_rules, table: pa.Table) -> pa.Table:
     return table
 
 
-def pa_split(array, sep="/"):
+def dictionary_encode(array) -> pa.DictionaryArray:
+    """
+    dictionary-encode an array or chunked array as a single DictionaryArray.
+    (arrays that are already dictionary-encoded are returned unchanged.)
+    """
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    return pac.dictionary_encode(array)
+
+
+def split_levels(array, sep="/"):
+    """
+    split each element of an array of paths into a table with one column
+    per directory level. this is the workhorse of pa_split(); apply it to
+    distinct values only.
+    """
     max_depth = pac.max(pac.count_substring(array, sep)).as_py()
+    if max_depth is None:
+        max_depth = 0
     pattern = "".join([f"(?:(?P<{n}>[^/]+){sep})?" for n in range(max_depth)])
     extracted = pac.extract_regex(array, pattern)
     # noinspection PyTypeChecker
     return pa.Table.from_arrays(
-        {n: pac.struct_field(extracted, [n]) for n in range(max_depth)},
+        [pac.struct_field(extracted, [n]) for n in range(max_depth)],
         tuple(map(str, range(max_depth))),
     )
 
 
+def pa_split(array, sep="/"):
+    """
+    split an array of paths into a table with one column per directory level.
+    only the distinct values of the array are split; the results are mapped
+    back to the full array by dictionary index.
+    """
+    encoded = dictionary_encode(array)
+    return split_levels(encoded.dictionary, sep).take(encoded.indices)
+
+
 def pa_extract_constants(table, drop_constants=False):
     constant_names = [
         n for n in table.schema.names if pac.count_distinct(table[n]) == 1
@@ -233,80 +273,248 @@ def make_countframe(
     filenames: Optional[pa.Array] = None,
     parts: Optional[pa.Table] = None
 ):
+    """
+    count files by directory structure and extension. 'parts' should be a
+    table produced by make_part_table(). rows are counted by (directory,
+    extension) first, and only directories that actually occur are split
+    into levels, so cost scales with the number of distinct directories.
+    """
     if (parts is None) and ((directories is None) or (filenames is None)):
         raise ValueError("directories + filenames, or parts, must be passed")
     if parts is None:
         parts = make_part_table(directories, filenames)
-        parts = pa_extract_constants(parts, drop_constants=True)[1].to_pandas()
-    else:
-        parts = parts.to_pandas()
-    count_df = parts.value_counts(dropna=False)
-    counts = count_df.values
-    count_df = count_df.index.to_frame().reset_index(drop=True)
-    count_df["count"] = counts
-    return count_df
+    dirs = dictionary_encode(parts["dir"])
+    counts = pa.table(
+        {"dir": dirs.indices, "ext": parts["ext"]}
+    ).group_by(["dir", "ext"]).aggregate(
+        [("dir", "count", pac.CountOptions(mode="all"))]
+    )
+    frame = split_levels(dirs.dictionary, "/").take(counts["dir"]).to_pandas()
+    frame["ext"] = counts["ext"].to_pandas()
+    frame["count"] = counts["dir_count"].to_pandas()
+    # distinct directories can share levels (the last level of each
+    # directory is not split out), so counts are merged again by level
+    return merge_countframes(frame)
 
 
 def make_part_table(directories, filenames):
-    parts = pa_split(directories, "/").append_column(
-        "ext", get_extensions(filenames)
+    """
+    construct a compact table of path parts: a dictionary-encoded 'dir'
+    column (whose dictionary can be split into levels with split_levels())
+    and an 'ext' column of file extensions.
+    """
+    return pa.table(
+        {
+            "dir": dictionary_encode(directories),
+            "ext": get_extensions(filenames),
+        }
     )
-    return parts
 
 
 def count_coverage(
-    manifest: pa.Table,
+    manifest: Union[pa.Table, Path, str],
     ignore_labels=(),
     label_extensions=LABEL_EXTENSIONS,
     ignore_extensions=IRRELEVANT_EXTENSIONS,
     ignore_directories=IGNORE_DIRECTORIES,
+    batch_size=COUNT_BATCH_SIZE,
 ):
-    manifest = filter_ignored_labels(ignore_labels, manifest)
+    """
+    compute coverage metrics and countframes for a coverage manifest. accepts
+    either an in-memory table or a path to a coverage manifest. the manifest
+    is tallied one batch at a time and the partial tallies are merged, so
+    memory use scales with the number of distinct values / directories in
+    the manifest rather than with its number of rows.
+    """
+    print("tallying coverage...", end="")
+    tally = None
+    for chunk in iter_manifest_chunks(manifest, batch_size=batch_size):
+        tally = merge_tallies(
+            tally,
+            tally_chunk(
+                chunk,
+                ignore_labels,
+                label_extensions,
+                ignore_extensions,
+                ignore_directories,
+            )
+        )
+    print("done")
+    if tally is None:
+        return {}
+    for label, n_excluded in tally["excluded_labels"].items():
+        print(f"excluded {n_excluded} files with label '{label}'")
     if ignore_directories is not None:
-        manifest, parts, ignored_parts = filter_ignored_directories(
-            ignore_directories, manifest
+        print(f"{tally['excluded_dirs']} files excluded by directory")
+    if tally["n_cov"] == 0:
+        print("note: none of this manifest is covered.")
+    if tally["covered_labels"] is True:
+        print("note: some labels are assigned as top-level covered.")
+    metrics = {}
+    if tally["n_cov"] > 0:
+        for field in ("dataset_ix", "ptype"):
+            metrics[field] = ix_metric_records(tally["metrics"][field], field)
+    for field in ("volume", "dataset_pds"):
+        metrics[field] = pds_metric_records(
+            tally["metrics"].get(field, {}), field, tally["n_cov"] > 0
         )
+    return {k: pd.DataFrame(v) for k, v in metrics.items()} | tally["frames"]
+
+
+def iter_manifest_chunks(
+    manifest: Union[pa.Table, Path, str],
+    columns=COUNT_COLUMNS,
+    batch_size=COUNT_BATCH_SIZE,
+) -> Iterator[pa.Table]:
+    """
+    yield successive slices of a manifest table or manifest file as tables.
+    files are read one row group at a time, and only the requested columns.
+    """
+    if isinstance(manifest, pa.Table):
+        batches = manifest.select(list(columns)).to_batches(batch_size)
+    else:
+        batches = iter_manifest_batches(manifest, batch_size, columns)
+    for batch in batches:
+        yield pa.Table.from_batches([batch])
+
+
+def tally_chunk(
+    chunk: pa.Table,
+    ignore_labels=(),
+    label_extensions=LABEL_EXTENSIONS,
+    ignore_extensions=IRRELEVANT_EXTENSIONS,
+    ignore_directories=IGNORE_DIRECTORIES,
+) -> dict:
+    """
+    compute partial coverage tallies for one slice of a manifest. tallies
+    from different slices can be combined with merge_tallies().
+    """
+    original_length = len(chunk)
+    tally = {
+        "excluded_labels": {},
+        "excluded_dirs": 0,
+        "n_cov": 0,
+        "n_ucov": 0,
+        "covered_labels": False,
+        "frames": {},
+        "metrics": {},
+    }
+    for label in ignore_labels:
+        chunk = filter_ignored_labels((label,), chunk, verbose=False)
+        tally["excluded_labels"][label] = original_length - len(chunk)
+        original_length = len(chunk)
+    if len(chunk) == 0:
+        return tally
+    if ignore_directories is not None:
+        chunk, parts, ignored_parts = filter_ignored_directories(
+            ignore_directories, chunk, verbose=False
+        )
+        tally["excluded_dirs"] = original_length - len(chunk)
     else:
-        parts, ignored_parts = None, None
-    print(f"finding coverage")
+        parts = make_part_table(chunk["url"], chunk["filename"])
+        ignored_parts = None
     cov, ucov, preds = find_covered(
-        manifest, label_extensions, ignore_extensions
+        chunk, ignore_extensions, label_extensions, verbose=False
     )
-    print("making countframes")
-    frames = {}
+    tally["n_cov"], tally["n_ucov"] = len(cov), len(ucov)
+    tally["covered_labels"] = pac.any(preds["cov_label"]).as_py() is True
     for name, tab in zip(("cov", "ucov"), (cov, ucov)):
-        if len(tab) == 0:
-            continue
-        if parts is None:
-            frames[name] = make_countframe(tab['url'], tab['filename'])
-        else:
-            frames[name] = make_countframe(parts=parts.filter(preds[name]))
-    if ignored_parts is not None:
-        frames["dir_ignore"] = make_countframe(parts=ignored_parts)
+        if len(tab) > 0:
+            tally["frames"][name] = make_countframe(
+                parts=parts.filter(preds[name])
+            )
+    if ignored_parts is not None and len(ignored_parts) > 0:
+        tally["frames"]["dir_ignore"] = make_countframe(parts=ignored_parts)
     del parts, ignored_parts
-    metrics = defaultdict(list)
     if len(cov) > 0:
         for field in ("dataset_ix", "ptype"):
-            metrics[field] = get_ix_metrics(cov, field)
+            tally["metrics"][field] = ix_metric_partials(cov, field)
     for field in ("volume", "dataset_pds"):
-        metrics[field] = get_pds_metrics(manifest, cov, ucov, field)
-    return {k: pd.DataFrame(v) for k, v in metrics.items()} | frames
+        tally["metrics"][field] = pds_metric_partials(chunk, cov, ucov, field)
+    return tally
+
+
+def merge_tallies(tally: Optional[dict], other: dict) -> dict:
+    """merge two partial tallies produced by tally_chunk()."""
+    if tally is None:
+        return other
+    for label, n_excluded in other["excluded_labels"].items():
+        tally["excluded_labels"][label] = (
+            tally["excluded_labels"].get(label, 0) + n_excluded
+        )
+    for key in ("excluded_dirs", "n_cov", "n_ucov"):
+        tally[key] += other[key]
+    tally["covered_labels"] = tally["covered_labels"] or other["covered_labels"]
+    for name, frame in other["frames"].items():
+        if name not in tally["frames"]:
+            tally["frames"][name] = frame
+        else:
+            tally["frames"][name] = merge_countframes(
+                tally["frames"][name], frame
+            )
+    for field, partials in other["metrics"].items():
+        tally["metrics"][field] = merge_metric_partials(
+            tally["metrics"].get(field, {}), partials
+        )
+    return tally
 
 
-def filter_ignored_directories(ignore_directories, manifest):
-    print("making part table for directory exclusion...", end="")
+def merge_countframes(*frames: pd.DataFrame) -> pd.DataFrame:
+    """
+    combine countframes, summing counts of identical paths. directory-level
+    columns absent from some frames (i.e., shallower trees) are filled with
+    empty strings, as pa_split() does for shallow paths.
+    """
+    merged = pd.concat(frames, ignore_index=True)
+    levels = sorted(
+        (c for c in merged.columns if c not in ("ext", "count")), key=int
+    )
+    merged[levels] = merged[levels].fillna("")
+    keys = levels + ["ext"]
+    merged = (
+        merged.groupby(keys, dropna=False, sort=False)["count"]
+        .sum()
+        .sort_values(ascending=False, kind="stable")
+    )
+    return merged.reset_index()
+
+
+def merge_metric_partials(partials: dict, other: dict) -> dict:
+    """
+    merge two mappings of {value: partial metric record}. integer fields are
+    summed; dict fields (used as ordered sets) are unioned.
+    """
+    for val, rec in other.items():
+        if val not in partials:
+            partials[val] = rec
+            continue
+        for k, v in rec.items():
+            if isinstance(v, dict):
+                partials[val][k].update(v)
+            else:
+                partials[val][k] += v
+    return partials
+
+
+def filter_ignored_directories(ignore_directories, manifest, verbose=True):
+    if verbose is True:
+        print("making part table for directory exclusion...", end="")
     parts = make_part_table(manifest["url"], manifest["filename"])
     original_length = len(manifest)
+    # check each distinct directory once, then map back to rows by index
+    dirs = dictionary_encode(parts["dir"])
+    levels = split_levels(dirs.dictionary, "/")
     igd_array = pa.array(ignore_directories)
-    exclusions = pac.is_in(pac.ascii_lower(parts[0]), igd_array)
-    for n in parts.schema.names:
-        if n in (0, "ext"):
-            continue
-        exclusions = pac.or_(
-            exclusions, pac.is_in(pac.ascii_lower(parts[n]), igd_array)
+    dir_exclusions = pa.array([False] * len(levels))
+    for n in levels.schema.names:
+        dir_exclusions = pac.or_(
+            dir_exclusions, pac.is_in(pac.ascii_lower(levels[n]), igd_array)
         )
+    exclusions = pac.fill_null(dir_exclusions.take(dirs.indices), False)
     manifest = manifest.filter(pac.invert(exclusions))
-    if len(manifest) < original_length:
+    if verbose is False:
+        pass
+    elif len(manifest) < original_length:
         print(f"{original_length - len(manifest)} files excluded")
     else:
         print("excluded no files")
@@ -317,13 +525,16 @@ def filter_ignored_directories(ignore_directories, manifest):
     )
 
 
-def filter_ignored_labels(ignore_labels, manifest):
+def filter_ignored_labels(ignore_labels, manifest, verbose=True):
     for label in ignore_labels:
-        print(f"excluding label '{label}'...", end="")
+        if verbose is True:
+            print(f"excluding label '{label}'...", end="")
         original_length = len(manifest)
         manifest = manifest.filter(
             pac.invert(pac.match_substring(manifest["label"], label))
         )
+        if verbose is False:
+            continue
         if len(manifest) < original_length:
             print(f"{original_length - len(manifest)} files excluded")
         else:
@@ -335,15 +546,17 @@ def find_covered(
     manifest,
     ignore_extensions=IRRELEVANT_EXTENSIONS,
     label_extensions=LABEL_EXTENSIONS,
+    verbose=True,
 ):
     preds = {"cov": pac.invert(pac.equal(manifest["dataset_ix"], ""))}
-    if pac.sum(preds["cov"]).as_py() == 0:
+    if verbose is True and pac.sum(preds["cov"]).as_py() == 0:
         print("note: none of this manifest is covered.")
     extensions = get_extensions(manifest["filename"])
     preds["label"] = pac.is_in(
         pac.ascii_lower(extensions), pa.array(label_extensions)
     )
-    if pac.any(pac.and_(preds["cov"], preds["label"])).as_py() is True:
+    preds["cov_label"] = pac.and_(preds["cov"], preds["label"])
+    if verbose is True and pac.any(preds["cov_label"]).as_py() is True:
         print("note: some labels are assigned as top-level covered.")
     preds["irrelevant"] = pac.is_in(
         pac.ascii_lower(extensions), pa.array(ignore_extensions)
@@ -352,13 +565,61 @@ def find_covered(
     preds["ucov"] = pac.and_(pac.invert(preds["cov"]), preds["good"])
     uncovered = manifest.filter(preds["ucov"])
     covered = manifest.filter(preds["cov"])
-    return covered, uncovered, keyfilter(lambda k: k in ("cov", "ucov"), preds)
+    return covered, uncovered, keyfilter(
+        lambda k: k in ("cov", "ucov", "cov_label"), preds
+    )
 
 
-# noinspection PyDictCreation
-def get_ix_metrics(covered, field):
-    print(f"counting {field}")
-    recs = []
+def grouped_records(table, key, aggregations):
+    """
+    aggregate a table by the values of a key column in a single pass,
+    returning a dict of {key value: {output column: aggregate}}, with groups
+    in order of first appearance (group_by does not guarantee that order).
+    """
+    grouped = table.group_by(key).aggregate(aggregations)
+    recs = {rec.pop(key): rec for rec in grouped.to_pylist()}
+    return {k: recs[k] for k in pac.unique(table[key]).to_pylist()}
+
+
+def grouped_distinct(table, key, column):
+    """
+    find the distinct values of 'column' for each value of a key column in a
+    single pass, returning a dict of {key value: {distinct value: None}}.
+    both levels are in order of first appearance. (neither pyarrow's
+    'distinct' aggregation nor multi-key group_by guarantees that order, so
+    this dictionary-encodes both columns and finds unique pairs of codes.)
+    """
+    keys, values = (
+        pac.dictionary_encode(
+            table[name].combine_chunks(), null_encoding="encode"
+        )
+        for name in (key, column)
+    )
+    n_values = len(values.dictionary)
+    pairs = pac.unique(
+        pac.add(
+            pac.multiply(keys.indices.cast(pa.int64()), n_values),
+            values.indices.cast(pa.int64())
+        )
+    )
+    key_ix = pac.divide(pairs, n_values)
+    value_ix = pac.subtract(pairs, pac.multiply(key_ix, n_values))
+    distinct = {}
+    for k, v in zip(
+        keys.dictionary.take(key_ix).to_pylist(),
+        values.dictionary.take(value_ix).to_pylist()
+    ):
+        distinct.setdefault(k, {})[v] = None
+    return distinct
+
+
+def ix_metric_partials(covered, field):
+    """
+    compute mergeable partial metrics for each value of an ix field
+    ('dataset_ix' or 'ptype') in a covered manifest table. sets of distinct
+    values are represented as dicts in order to preserve order of first
+    appearance.
+    """
     if field == "ptype":
         ref = pac.binary_join_element_wise(
             covered['dataset_ix'], covered['ptype'], ';'
@@ -367,23 +628,65 @@ def get_ix_metrics(covered, field):
         ref = covered["dataset_ix"]
     else:
         raise ValueError(f"unknown field {field}")
-    vals = pac.unique(ref).to_pylist()
-    for val in filter(lambda v: v not in ("", ";"), vals):
-        match = covered.filter(pac.equal(ref, val))
-        rec = {field: val, "count": len(match)}
+    table = pa.table(
+        {"ref": ref}
+        | {c: covered[c] for c in ("ptype", "volume", "dataset_pds", "label")}
+        | {"size": covered["size"]}
+    )
+    table = table.filter(
+        pac.invert(pac.is_in(table["ref"], pa.array(["", ";"])))
+    )
+    totals = grouped_records(
+        table,
+        "ref",
+        [("ref", "count", pac.CountOptions(mode="all")), ("size", "sum")]
+    )
+    distinct = {
+        name: grouped_distinct(table, "ref", column)
+        for name, column in (
+            ("ptypes", "ptype"),
+            ("volumes", "volume"),
+            ("datasets_pds", "dataset_pds"),
+            ("labels", "label"),
+        )
+        if name != "ptypes" or field == "dataset_ix"
+    }
+    partials = {}
+    for val, total in totals.items():
+        if val is None:
+            continue
+        partial = {"count": total["ref_count"]}
+        for name, values in distinct.items():
+            partial[name] = values[val]
+        partial["size"] = total["size_sum"]
+        partials[val] = partial
+    return partials
+
+
+# noinspection PyDictCreation
+def ix_metric_records(partials, field):
+    """construct output records from (merged) ix metric partials."""
+    recs = []
+    for val, partial in partials.items():
+        rec = {field: val, "count": partial["count"]}
         if field == "dataset_ix":
-            rec["ptypes"] = pac.unique(match["ptype"]).to_pylist()
-        rec["volumes"] = pac.unique(match["volume"]).to_pylist()
-        rec["datasets_pds"] = pac.unique(match["dataset_pds"]).to_pylist()
+            rec["ptypes"] = list(partial["ptypes"])
+        rec["volumes"] = list(partial["volumes"])
+        rec["datasets_pds"] = list(partial["datasets_pds"])
         rec["n_dataset"] = len(rec["datasets_pds"])
         rec["n_volume"] = len(rec["volumes"])
-        rec["total_mb"] = pac.sum(match["size"]).as_py() / 1024 ** 2
+        rec["total_mb"] = partial["size"] / 1024 ** 2
         rec["mean_mb"] = rec["total_mb"] / rec["count"]
-        rec["labels"] = pac.unique(match["label"]).to_pylist()
+        rec["labels"] = list(partial["labels"])
         recs.append(rec)
     return recs
 
 
+def get_ix_metrics(covered, field):
+    print(f"counting {field}")
+    return ix_metric_records(ix_metric_partials(covered, field), field)
+
+
 def null_pds_metric(count):
     return {
         "datasets_ix": [],
@@ -396,32 +699,57 @@ def null_pds_metric(count):
     }
 
 
-def get_pds_metrics(manifest, covered, uncovered, field):
-    print(f"counting {field}")
+def pds_metric_partials(manifest, covered, uncovered, field):
+    """
+    compute mergeable partial metrics for each value of a PDS field
+    ('volume' or 'dataset_pds') in a manifest table. see ix_metric_partials().
+    """
+    count_all = (field, "count", pac.CountOptions(mode="all"))
+    totals = grouped_records(manifest.select([field]), field, [count_all])
+    labels = grouped_distinct(manifest, field, "label")
+    n_covered = grouped_records(covered.select([field]), field, [count_all])
+    datasets_ix = grouped_distinct(covered, field, "dataset_ix")
+    ptypes = grouped_distinct(covered, field, "ptype")
+    n_uncovered = grouped_records(
+        uncovered.select([field]), field, [count_all]
+    )
+    partials, count_name = {}, f"{field}_count"
+    for val, total in totals.items():
+        if val in ("", None):
+            continue
+        partials[val] = {
+            "count": total[count_name],
+            "labels": labels[val],
+            "datasets_ix": datasets_ix.get(val, {}),
+            "ptypes": ptypes.get(val, {}),
+            "n_covered": n_covered.get(val, {count_name: 0})[count_name],
+            "n_uncovered": n_uncovered.get(val, {count_name: 0})[count_name],
+        }
+    return partials
+
+
+def pds_metric_records(partials, field, any_covered=True):
+    """
+    construct output records from (merged) PDS metric partials. if nothing
+    in the manifest is covered, all values get null metrics.
+    """
     recs = []
-    vals = pac.unique(manifest[field]).to_pylist()
-    for val in filter(lambda v: v != "", vals):
-        match_pred = pac.equal(manifest[field], val)
+    for val, partial in partials.items():
         rec = {
             field: val,
-            "count": pac.sum(match_pred).as_py(),
-            "labels": pac.unique(
-                manifest.filter(match_pred)["label"]
-            ).to_pylist(),
+            "count": partial["count"],
+            "labels": list(partial["labels"]),
         }
-        del match_pred
-        if len(covered) == 0:
+        if any_covered is False:
             recs.append(rec | null_pds_metric(rec["count"]))
             continue
-        match = covered.filter(pac.equal(covered[field], val))
-        rec["datasets_ix"] = pac.unique(match["dataset_ix"]).to_pylist()
-        rec["ptypes"] = pac.unique(match["ptype"]).to_pylist()
+        rec["datasets_ix"] = list(partial["datasets_ix"])
+        rec["ptypes"] = list(partial["ptypes"])
         rec["n_datasets_ix"] = len(rec["datasets_ix"])
         rec["n_ptypes"] = len(rec["ptypes"])
-        rec["n_covered"] = len(match)
-        ucmatch = uncovered.filter(pac.equal(uncovered[field], val))
-        rec["n_uncovered"] = len(ucmatch)
-        if (len(ucmatch) + len(match)) == 0:
+        rec["n_covered"] = partial["n_covered"]
+        rec["n_uncovered"] = partial["n_uncovered"]
+        if (rec["n_covered"] + rec["n_uncovered"]) == 0:
             rec["coverage"] = float("nan")
         else:
             rec["coverage"] = rec["n_covered"] / (
@@ -431,6 +759,15 @@ def get_pds_metrics(manifest, covered, uncovered, field):
     return recs
 
 
+def get_pds_metrics(manifest, covered, uncovered, field):
+    print(f"counting {field}")
+    return pds_metric_records(
+        pds_metric_partials(manifest, covered, uncovered, field),
+        field,
+        len(covered) > 0
+    )
+
+
 def load_and_count(
     manifest_path,
     ignore_labels=(),
@@ -438,28 +775,18 @@ def load_and_count(
     label_extensions=LABEL_EXTENSIONS,
     ignore_directories=IGNORE_DIRECTORIES,
     write=False,
+    batch_size=COUNT_BATCH_SIZE,
 ):
     manifest_path = Path(manifest_path)
     if "coverage.parquet" not in manifest_path.name:
         raise ValueError("this does not appear to be a coverage manifest.")
     metrics = count_coverage(
-        parquet.read_table(
-            manifest_path,
-            columns=[
-                "url",
-                "filename",
-                "dataset_ix",
-                "dataset_pds",
-                "volume",
-                "ptype",
-                "size",
-                "label",
-            ],
-        ),
+        manifest_path,
         ignore_labels,
         label_extensions,
         ignore_extensions,
-        ignore_directories
+        ignore_directories,
+        batch_size
     )
     if (write is True) and (len(metrics) > 0):
         for k, v in metrics.items():
@@ -1,8 +1,10 @@
 """troubleshooting & benchmarking utilities"""
 import _ctypes
 import gc
+import subprocess
+import sys
 import time
-from typing import Mapping
+from typing import Mapping, Sequence
 
 
 class FakeStopwatch:
@@ -87,4 +89,94 @@ def print_references(
 
 
 def di(obj_id):
-    return _ctypes.PyObj_FromPtr(obj_id)
\ No newline at end of file
+    return _ctypes.PyObj_FromPtr(obj_id)
+
+# modules that the ix CLI should not import just to parse arguments or to
+# run actions that only need selection rules or settings
+HEAVY_MODULES = (
+    "boto3",
+    "dustgoggles",
+    "hostess",
+    "numpy",
+    "pandas",
+    "pdr",
+    "pyarrow",
+    "requests",
+)
+
+
+def import_times(argv: Sequence[str]) -> dict[str, tuple[int, int]]:
+    """
+    run a python command line in a fresh interpreter with -X importtime.
+    returns {module: (self microseconds, cumulative microseconds)} for every
+    module it imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv],
+        capture_output=True,
+        text=True,
+    )
+    times, errors = {}, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+        elif "[us]" not in line:
+            own, cumulative, name = (
+                line.removeprefix("import time:").split("|")
+            )
+            times[name.strip()] = (int(own), int(cumulative))
+    _check_run(argv, result.returncode, "\n".join(errors))
+    return times
+
+
+def _check_run(argv: Sequence[str], returncode: int, stderr: str):
+    """don't benchmark a command line that failed"""
+    if returncode != 0:
+        raise RuntimeError(
+            f"'python {' '.join(argv)}' exited with code {returncode}:\n"
+            f"{stderr}"
+        )
+
+
+def ix_import_benchmark(
+    actions: Sequence[Sequence[str]] = (("--help",), ("ls",), ("count",)),
+    n_runs: int = 5,
+    budget: float = 0.2,
+) -> bool:
+    """
+    time fresh 'ix' invocations of each of 'actions' (best of n_runs) and
+    list any HEAVY_MODULES they import. returns False if any of them takes
+    longer than 'budget' seconds or imports a heavy module. run as
+    'python -m pdr_tests.utilz.dev_utilz' to check after changing imports.
+    note that 'ix ls' is answered by 'ix serve' if it is running.
+    """
+    ok = True
+    for action in actions:
+        argv = ["-m", "pdr_tests.ix", *action]
+        runs = []
+        for _ in range(n_runs):
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, *argv], capture_output=True, text=True
+            )
+            runs.append(time.perf_counter() - start)
+            _check_run(argv, result.returncode, result.stderr)
+        times = import_times(argv)
+        heavy = sorted(
+            {m.split(".")[0] for m in times} & set(HEAVY_MODULES)
+        )
+        slowest = sorted(times.items(), key=lambda kv: -kv[1][1])[:5]
+        print(
+            f"ix {' '.join(action)}: {min(runs):.3f} s, "
+            f"{sum(t[0] for t in times.values()) / 1e6:.3f} s in imports"
+        )
+        for name, (_, cumulative) in slowest:
+            print(f"    {cumulative / 1e6:.3f} s  {name}")
+        if len(heavy) > 0:
+            print(f"    imports heavy modules: {', '.join(heavy)}")
+        ok = ok and min(runs) <= budget and len(heavy) == 0
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if ix_import_benchmark() else 1)
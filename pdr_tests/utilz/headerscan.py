@@ -1,19 +1,191 @@
-from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial, reduce
+from operator import mul
+import os
 from pathlib import Path
 from re import Pattern
+from types import SimpleNamespace
 from typing import Optional, Union
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 from dustgoggles.structures import unnest
 from hostess.directory import do_magic, index_breadth_first, LSFrame
+from more_itertools import chunked
 from multidict import MultiDict
+from pyarrow import parquet as pq
 from rich.progress import Progress
 
 import pdr
+from pdr.parselabel.pds3 import DEFAULT_PVL_LIMIT, read_pvl
+from pdr.pdr import Metadata
 
+from pdr_tests.utilz.label_utilz import cached_labels, cached_read_pvl
 
-def open_attached(fn):
-    return pdr.read(fn, label_fn=fn, skip_existence_check=True)
+FITS_BLOCK_SIZE = 2880
+
+
+def open_attached(fn, **read_kwargs):
+    return pdr.read(fn, label_fn=fn, skip_existence_check=True, **read_kwargs)
+
+
+def _fits_data_size(header) -> int:
+    """size in bytes of the data unit following a FITS header, with padding"""
+    naxes = [header.get(f"NAXIS{n}", 0) for n in range(1, header["NAXIS"] + 1)]
+    if header.get("GROUPS") is True and naxes[:1] == [0]:
+        # random groups: NAXIS1 = 0 is a placeholder
+        naxes = naxes[1:]
+    if len(naxes) == 0:
+        return 0
+    size = (
+        abs(header["BITPIX"]) // 8
+        * header.get("GCOUNT", 1)
+        * (header.get("PCOUNT", 0) + reduce(mul, naxes, 1))
+    )
+    return -(-size // FITS_BLOCK_SIZE) * FITS_BLOCK_SIZE
+
+
+def read_fits_headers(
+    filename: Union[str, Path], max_bytes: int = DEFAULT_PVL_LIMIT
+) -> Metadata:
+    """
+    read every header of a FITS file a block at a time, seeking past data
+    units, into a Metadata object like the one pdr makes for primary FITS
+    files. reads no more than max_bytes of any one header.
+    """
+    from astropy.io import fits
+    from pdr.loaders.handlers import handle_fits_header
+
+    headers = []
+    with open(filename, "rb") as stream:
+        while (block := stream.read(FITS_BLOCK_SIZE)) != b"":
+            text = block
+            # the END card is blank-padded to 80 characters and always starts
+            # a card, so it can only be the last card of a block
+            while not any(
+                block[i:i + 80].rstrip() == b"END"
+                for i in range(0, len(block), 80)
+            ):
+                if (block := stream.read(FITS_BLOCK_SIZE)) == b"":
+                    raise ValueError("FITS header has no END card")
+                if len(text) >= max_bytes:
+                    raise ValueError(f"no END card in first {max_bytes} bytes")
+                text += block
+            header = fits.Header.fromstring(text.decode("ascii"))
+            headers.append(SimpleNamespace(header=header))
+            stream.seek(_fits_data_size(header), os.SEEK_CUR)
+    if len(headers) == 0:
+        raise ValueError("empty file")
+    # name HDUs as pdr.loaders.handlers.unpack_fits_headers() does
+    names = ["PRIMARY"] + [
+        str(h.header.get("EXTNAME", "")).strip().upper() for h in headers[1:]
+    ]
+    mapping, params = MultiDict(), []
+    for ix, name in enumerate(names):
+        if names.count(name) > 1:
+            name = f"{name}_{names[:ix].count(name)}"
+        mapping.add(name, handle_fits_header(headers, ix))
+        params += [name, *mapping[name].keys()]
+    return Metadata((mapping, params), standard="FITS")
+
+
+def read_header_metadata(
+    filename: Union[str, Path], use_label_cache: bool = True
+) -> Metadata:
+    """
+    read only the label of a product with an attached PDS3 label (or a
+    detached PVL label) or the headers of a FITS file, without opening the
+    product with pdr.read().
+    """
+    with open(filename, "rb") as stream:
+        magic = stream.read(9)
+    if magic == b"SIMPLE  =":
+        return read_fits_headers(filename)
+    # read_pvl() reads only as far as the end of the label
+    if use_label_cache is True:
+        return Metadata(cached_read_pvl(filename))
+    return Metadata(read_pvl(filename))
+
+
+def _scan_manifest(root, manifest, path_regex, magic):
+    if root is None and manifest is None:
+        raise TypeError(
+            "must pass a root directory or a preconstructed TreeFrame"
+        )
+    if manifest is None:
+        manifest = pd.DataFrame(index_breadth_first(root))
+    if len(manifest) == 0:
+        raise FileNotFoundError("no files in tree")
+    manifest = manifest.loc[manifest['directory'] == False]
+    if path_regex is not None:
+        manifest = manifest.loc[manifest['path'].str.match(path_regex)]
+        if len(manifest) == 0:
+            raise FileNotFoundError("no files in tree match regex")
+    if magic is True:
+        manifest = do_magic(manifest)
+    return manifest
+
+
+def scan_header(
+    path: str,
+    attached_labels: bool = True,
+    level_sep: str = "",
+    use_label_cache: bool = True,
+    header_only: bool = False,
+    read_kwargs: Optional[dict] = None,
+) -> tuple[Optional[dict], Optional[dict]]:
+    """
+    read the metadata of a single product and flatten it into a record.
+    returns (record, None) on success and (None, glitch) on failure.
+    """
+    read_kwargs = {} if read_kwargs is None else read_kwargs
+    if header_only is True and not str(path).lower().endswith(".xml"):
+        reader = partial(
+            read_header_metadata, use_label_cache=use_label_cache
+        )
+    elif attached_labels is True:
+        reader = partial(open_attached, **read_kwargs)
+    else:
+        reader = partial(pdr.read, skip_existence_check=True, **read_kwargs)
+    try:
+        with cached_labels() if use_label_cache else nullcontext():
+            metadata = reader(path)
+            if not isinstance(metadata, Metadata):
+                metadata = metadata.metadata
+    except KeyboardInterrupt:
+        raise
+    except Exception as ex:
+        return None, {'path': path, 'err': f'{type(ex).__name__}: {ex}'}
+    if len(metadata) == 0:
+        return None, {'path': path, 'err': 'no metadata found'}
+    record = unnest(metadata, mtypes=(dict, MultiDict), escape=level_sep)
+    record = {
+        k: v.strip('"') if isinstance(v, str) else v
+        for k, v in record.items()
+    }
+    record['path'] = path
+    return record, None
+
+
+def _scan_batches(paths, n_workers, batch_size, scanner):
+    """yield lists of scan_header() results, batch_size paths at a time."""
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    if n_workers == 1:
+        for batch in chunked(paths, batch_size):
+            yield list(map(scanner, batch))
+        return
+    with ProcessPoolExecutor(n_workers) as pool:
+        for batch in chunked(paths, batch_size):
+            yield list(
+                pool.map(
+                    scanner,
+                    batch,
+                    chunksize=max(len(batch) // (n_workers * 4), 1),
+                )
+            )
 
 
 def scan_headers(
@@ -23,6 +195,9 @@ def scan_headers(
     attached_labels: bool = True,
     level_sep: str = "",
     magic: bool = False,
+    use_label_cache: bool = True,
+    header_only: bool = False,
+    n_workers: int = 1,
     **read_kwargs
 ) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
@@ -74,6 +249,15 @@ def scan_headers(
             to a '_')
         magic: if True, add filetype information, as given by `file`, to the
             file manifest. may be very slow or not work on some systems.
+        use_label_cache: if True, read PDS3 labels through the on-disk
+            parsed-label cache (see pdr_tests.utilz.label_utilz).
+        header_only: if True, read only the labels of products with attached
+            PDS3 labels, and only the headers of FITS files, rather than
+            opening them with pdr.read(). much cheaper for big products, but
+            ignores attached_labels and read_kwargs. does not apply to PDS4
+            (.xml) labels.
+        n_workers: number of processes to read files with. see also
+            scan_headers_to_parquet() for trees too big to hold in memory.
         **read_kwargs: additional kwargs to pass to pdr.read
 
     Returns:
@@ -82,61 +266,111 @@ def scan_headers(
             1: file manifest DataFrame
             2: DataFrame with information on failed reads
     """
-    if root is None and manifest is None:
-        raise TypeError(
-            "must pass a root directory or a preconstructed TreeFrame"
+    manifest = _scan_manifest(root, manifest, path_regex, magic)
+    scanner = partial(
+        scan_header,
+        attached_labels=attached_labels,
+        level_sep=level_sep,
+        use_label_cache=use_label_cache,
+        header_only=header_only,
+        read_kwargs=read_kwargs,
+    )
+    glitched, records = [], []
+    with Progress() as progress:
+        scan_task = progress.add_task(
+            "[green]scanning...", total=len(manifest)
         )
-    if manifest is None:
-        manifest = pd.DataFrame(index_breadth_first(root))
-    if len(manifest) == 0:
-        raise FileNotFoundError("no files in tree")
-    manifest = manifest.loc[manifest['directory'] == False]
-    if path_regex is not None:
-        manifest = manifest.loc[manifest['path'].str.match(path_regex)]
-        if len(manifest) == 0:
-            raise FileNotFoundError("no files in tree match regex")
-    if magic is True:
-        manifest = do_magic(manifest)
-    if attached_labels is True:
-        reader = partial(open_attached, **read_kwargs)
-    else:
-        reader = partial(pdr.read, skip_existence_check=True, **read_kwargs)
-    glitched, metadatas = [], []
+        for results in _scan_batches(
+            manifest['path'].tolist(), n_workers, 100, scanner
+        ):
+            for record, glitch in results:
+                if glitch is None:
+                    records.append(record)
+                else:
+                    glitched.append(glitch)
+            progress.update(scan_task, advance=len(results))
+    return pd.DataFrame(records), manifest, pd.DataFrame(glitched)
+
+
+def scan_headers_to_parquet(
+    output: Union[str, Path],
+    root: Union[str, Path] = None,
+    manifest: Optional[LSFrame] = None,
+    path_regex: Optional[Union[str, Pattern]] = None,
+    attached_labels: bool = True,
+    level_sep: str = "",
+    magic: bool = False,
+    use_label_cache: bool = True,
+    header_only: bool = False,
+    n_workers: Optional[int] = None,
+    batch_size: int = 5000,
+    **read_kwargs
+) -> tuple[ds.Dataset, pd.DataFrame, pd.DataFrame]:
+    """
+    like scan_headers(), but scans in a pool of n_workers processes (default
+    one per CPU) and writes flattened metadata to a directory of Parquet
+    files, one per batch_size products, rather than holding it in memory.
+    so that columns can be added as new keys appear without type conflicts
+    between batches, all metadata values are stored as strings.
+
+    Returns:
+        tuple whose elements are:
+            0: pyarrow Dataset over the metadata files in 'output', whose
+                schema includes every key found in any file
+            1: file manifest DataFrame
+            2: DataFrame with information on failed reads
+    """
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    for stale in output.glob("part-*.parquet"):
+        stale.unlink()
+    manifest = _scan_manifest(root, manifest, path_regex, magic)
+    scanner = partial(
+        scan_header,
+        attached_labels=attached_labels,
+        level_sep=level_sep,
+        use_label_cache=use_label_cache,
+        header_only=header_only,
+        read_kwargs=read_kwargs,
+    )
+    # dict as ordered set of column names across all batches
+    glitched, columns, parts = [], {}, []
     with Progress() as progress:
         scan_task = progress.add_task(
             "[green]scanning...", total=len(manifest)
         )
-        n = 0
-        for _, product in manifest.iterrows():
-            try:
-                metadata = reader(product['path']).metadata
-                if len(metadata) == 0:
-                    glitched.append(
-                        {'path': product['path'], 'err': 'no metadata found'}
+        for results in _scan_batches(
+            manifest['path'].tolist(), n_workers, batch_size, scanner
+        ):
+            records = []
+            for record, glitch in results:
+                if glitch is None:
+                    records.append(
+                        {
+                            k: None if v is None else str(v)
+                            for k, v in record.items()
+                        }
                     )
                 else:
-                    metadata['path'] = product['path']
-                    metadatas.append(metadata)
-                del metadata
-            except KeyboardInterrupt:
-                raise
-            except Exception as ex:
-                glitched.append(
-                    {
-                        'path': product['path'],
-                        'err': f'{type(ex).__name__}: {ex}'
-                    }
+                    glitched.append(glitch)
+            if len(records) > 0:
+                batch_columns = dict.fromkeys(
+                    k for record in records for k in record
+                )
+                columns |= batch_columns
+                part = output / f"part-{len(parts):05d}.parquet"
+                pq.write_table(
+                    pa.Table.from_pylist(
+                        records,
+                        pa.schema([(k, pa.string()) for k in batch_columns]),
+                    ),
+                    part,
                 )
-            if n % 100 == 0:
-                progress.update(scan_task, advance=100)
-            n += 1
-        flat = pd.DataFrame([
-            unnest(metadata, mtypes=(dict, MultiDict), escape=level_sep)
-            for metadata in metadatas
-        ])
-        for c in flat.columns:
-            try:
-                flat[c] = flat[c].str.strip('"')
-            except AttributeError:
-                continue
-        return flat.copy(), manifest, pd.DataFrame(glitched)
+                parts.append(str(part))
+            progress.update(scan_task, advance=len(results))
+    schema = pa.schema([(k, pa.string()) for k in columns])
+    return (
+        ds.dataset(parts, schema=schema, format="parquet"),
+        manifest,
+        pd.DataFrame(glitched),
+    )
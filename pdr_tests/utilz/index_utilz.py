@@ -0,0 +1,147 @@
+"""
+typed access to index and test index CSV files. the 'files' and 'hash'
+columns of these files hold JSON; read_index() returns them parsed, as
+lists and dicts, and caches the parsed table as a Parquet file (with
+list<string> and map<string, string> columns) in settings.index_cache_dir,
+so that each CSV is parsed once per change rather than once per row per
+run. the CSVs remain the human-editable source of truth: a cached table is
+only used while the size and mtime of its CSV match those recorded in it.
+"""
+from hashlib import md5
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import parquet as pq
+
+from pdr_tests.settings import SETTINGS
+
+# columns of index CSVs that contain JSON, and their types once parsed
+INDEX_JSON_COLUMNS = {
+    "files": pa.list_(pa.string()),
+    "hash": pa.map_(pa.string(), pa.string()),
+}
+
+
+def _csv_state(csv_path: Path) -> bytes:
+    stat = csv_path.stat()
+    return json.dumps([stat.st_size, stat.st_mtime_ns]).encode()
+
+
+def index_cache_path(
+    csv_path: Union[str, Path], cache_dir: Optional[Path] = None
+) -> Path:
+    if cache_dir is None:
+        cache_dir = SETTINGS.index_cache_dir
+    csv_path = Path(csv_path).absolute()
+    key = md5(str(csv_path).encode(), usedforsecurity=False).hexdigest()
+    return Path(cache_dir, f"{csv_path.stem}-{key[:12]}.parquet")
+
+
+def _parse_json(value):
+    # empty cells read as NaN; test_product() returns "" for products it
+    # couldn't hash
+    if isinstance(value, str) and value.strip() != "":
+        return json.loads(value)
+    return None
+
+
+def _to_table(index: pd.DataFrame) -> pa.Table:
+    plain = [c for c in index.columns if c not in INDEX_JSON_COLUMNS]
+    table = pa.Table.from_pandas(index[plain], preserve_index=False)
+    for column, pa_type in INDEX_JSON_COLUMNS.items():
+        if column not in index.columns:
+            continue
+        values = index[column].tolist()
+        if pa.types.is_map(pa_type):
+            values = [None if v is None else list(v.items()) for v in values]
+        table = table.append_column(column, pa.array(values, pa_type))
+    return table.select(list(index.columns))
+
+
+def _from_table(table: pa.Table) -> pd.DataFrame:
+    json_columns = [c for c in table.column_names if c in INDEX_JSON_COLUMNS]
+    index = table.drop(json_columns).to_pandas()
+    for column in json_columns:
+        values = table.column(column).to_pylist()
+        if pa.types.is_map(INDEX_JSON_COLUMNS[column]):
+            values = [None if v is None else dict(v) for v in values]
+        index[column] = values
+    return index[table.column_names]
+
+
+def _write_cache(
+    index: pd.DataFrame, csv_path: Path, cache_path: Path
+):
+    table = _to_table(index)
+    table = table.replace_schema_metadata({b"csv_state": _csv_state(csv_path)})
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # write-then-rename, so concurrent readers never see partial files
+    tempfd, temp_name = tempfile.mkstemp(dir=cache_path.parent, suffix=".part")
+    os.close(tempfd)
+    try:
+        pq.write_table(table, temp_name)
+        os.replace(temp_name, cache_path)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+
+def read_index(
+    csv_path: Union[str, Path], cache_dir: Optional[Path] = None
+) -> pd.DataFrame:
+    """
+    read an index or test index CSV file, with its 'files' column parsed to
+    lists and its 'hash' column parsed to dicts (None where empty).
+    """
+    csv_path = Path(csv_path)
+    cache_path = index_cache_path(csv_path, cache_dir)
+    try:
+        table = pq.read_table(cache_path)
+        if table.schema.metadata[b"csv_state"] == _csv_state(csv_path):
+            return _from_table(table)
+    except (FileNotFoundError, KeyError, TypeError, pa.ArrowInvalid):
+        pass
+    index = pd.read_csv(csv_path)
+    for column in INDEX_JSON_COLUMNS:
+        if column in index.columns:
+            index[column] = index[column].map(_parse_json).astype(object)
+    try:
+        _write_cache(index, csv_path, cache_path)
+    except OSError:
+        # e.g. unwritable cache directory; just parse the CSV next time
+        pass
+    return index
+
+
+def write_index(
+    index: pd.DataFrame,
+    csv_path: Union[str, Path],
+    cache_dir: Optional[Path] = None,
+):
+    """
+    write a table like those returned by read_index() to a CSV file, and
+    refresh its cached Parquet copy. values of the JSON columns may be
+    parsed objects or JSON strings.
+    """
+    csv_path = Path(csv_path)
+    index = index.copy()
+    for column in INDEX_JSON_COLUMNS:
+        if column in index.columns:
+            index[column] = [
+                _parse_json(v) if not isinstance(v, (list, dict)) else v
+                for v in index[column]
+            ]
+    serialized = index.copy()
+    for column in INDEX_JSON_COLUMNS:
+        if column in serialized.columns:
+            serialized[column] = [
+                None if v is None else json.dumps(v)
+                for v in serialized[column]
+            ]
+    serialized.to_csv(csv_path, index=False)
+    _write_cache(index, csv_path, index_cache_path(csv_path, cache_dir))
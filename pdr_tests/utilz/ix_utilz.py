@@ -1,12 +1,19 @@
 """support objects and logging procedures for ix framework."""
+import atexit
+from contextlib import contextmanager
+from contextvars import ContextVar
 import datetime as dt
 import json
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import multiprocessing as mp
 import os
+import queue
 import tempfile
 import time
 import warnings
 import xml.etree.ElementTree as ET
+import zlib
 from functools import wraps
 from hashlib import md5
 from io import StringIO
@@ -33,29 +40,166 @@ from multidict import MultiDict
 
 import pdr
 from pdr.pdr import Data
-from pdr.parselabel.pds3 import read_pvl
+from pdr.parselabel.pds3 import DEFAULT_PVL_LIMIT, read_pvl
 from pdr.utils import check_cases
 
 import pdr_tests
-from pdr_tests.definitions import RULES_MODULES
 from pdr_tests.utilz.dev_utilz import Stopwatch
+from pdr_tests.utilz.label_utilz import cached_read_pvl, find_label_end
+from pdr_tests.utilz.manifest_utilz import (
+    iter_manifest_batches,
+    manifest_file,
+    read_manifest,
+    row_group_offsets,
+    take_manifest_rows,
+)
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """formats each record as a JSON object, including log_context() fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": dt.datetime.fromtimestamp(
+                record.created, dt.timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "process": record.processName,
+            "pid": record.process,
+            **getattr(record, "context", {}),
+            "message": record.getMessage(),
+        }
+        return json.dumps(entry, default=str)
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler that writes records in batches of 'capacity', immediately
+    for records of level ERROR and above, and when closed.
+    """
+
+    def __init__(self, filename: str, capacity: int = 256):
+        super().__init__(filename, delay=True)
+        self.capacity, self.buffer = capacity, []
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.buffer.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+        if (
+            len(self.buffer) >= self.capacity
+            or record.levelno >= logging.ERROR
+        ):
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if len(self.buffer) == 0:
+                return
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write("".join(f"{line}\n" for line in self.buffer))
+            self.stream.flush()
+            self.buffer.clear()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+_LOG_CONTEXT: ContextVar[dict] = ContextVar("log_context", default={})
+
+
+@contextmanager
+def log_context(**fields):
+    """add 'fields' to everything logged from this thread in this context."""
+    token = _LOG_CONTEXT.set(_LOG_CONTEXT.get() | fields)
+    try:
+        yield
+    finally:
+        _LOG_CONTEXT.reset(token)
+
+
+def _add_log_context(record: logging.LogRecord) -> bool:
+    record.context = _LOG_CONTEXT.get()
+    return True
+
+
+def _queue_handler(queue_) -> QueueHandler:
+    handler = QueueHandler(queue_)
+    handler.addFilter(_add_log_context)
+    return handler
 
 
 PDRTESTLOG = logging.getLogger()
+# records are put on LOG_QUEUE by the logging thread and formatted and written
+# to pdrtests.log by a listener thread, so that logging calls don't wait on
+# disk. worker processes log through worker_log_queue() instead.
+LOG_QUEUE, _LOG_LISTENERS, _WORKER_LOG_QUEUE = None, [], None
 if len(PDRTESTLOG.handlers) == 0:
-    PDRTESTLOG.addHandler(logging.FileHandler("pdrtests.log"))
+    LOG_QUEUE = queue.SimpleQueue()
+    _LOG_FILE_HANDLER = BufferedFileHandler("pdrtests.log")
+    _LOG_FILE_HANDLER.setFormatter(JSONLinesFormatter())
+    _LOG_LISTENERS.append(QueueListener(LOG_QUEUE, _LOG_FILE_HANDLER))
+    _LOG_LISTENERS[0].start()
+    PDRTESTLOG.addHandler(_queue_handler(LOG_QUEUE))
+
+    @atexit.register
+    def _stop_logging():
+        for listener in _LOG_LISTENERS:
+            listener.stop()
+        _LOG_FILE_HANDLER.close()
+
 PDRTESTLOG.setLevel("INFO")
 
 
+def worker_log_queue() -> Optional[mp.Queue]:
+    """
+    multiprocessing queue for worker processes to log to, written to the log
+    file by a listener thread in this process (see init_worker_logging()).
+    created on first call, so that importing this module does not fix the
+    multiprocessing start method. None if logging was configured elsewhere.
+    """
+    global _WORKER_LOG_QUEUE
+    if LOG_QUEUE is None:
+        return None
+    if _WORKER_LOG_QUEUE is None:
+        _WORKER_LOG_QUEUE = mp.Queue()
+        _LOG_LISTENERS.append(
+            QueueListener(_WORKER_LOG_QUEUE, _LOG_FILE_HANDLER)
+        )
+        _LOG_LISTENERS[-1].start()
+    return _WORKER_LOG_QUEUE
+
+
+def init_worker_logging(queue_, context: Optional[dict] = None):
+    """
+    initializer for worker processes: send log records to 'queue_' (from
+    worker_log_queue() in the parent process), tagged with 'context'.
+    """
+    if queue_ is not None:
+        for handler in PDRTESTLOG.handlers.copy():
+            PDRTESTLOG.removeHandler(handler)
+        PDRTESTLOG.addHandler(_queue_handler(queue_))
+    if context is not None:
+        _LOG_CONTEXT.set(context)
+
+
 def stamp() -> str:
     return f"{dt.datetime.utcnow().isoformat()[:-7]}: "
 
 
 def console_and_log(message, level="info", do_stamp=True, quiet=False):
-    stamp_txt = stamp() if do_stamp is True else ""
-    getattr(PDRTESTLOG, level)(f"{stamp_txt}{message}")
+    # the log file has its own timestamps
+    getattr(PDRTESTLOG, level)(message)
     if not quiet:
-        print(f"{stamp_txt}{message}")
+        stamp_txt = stamp() if do_stamp is True else ""
+        # one write per line, so lines from parallel workers don't interleave
+        print(f"{stamp_txt}{message}\n", end="")
 
 
 def find_manifest(fn: str, manifest_dir: Path):
@@ -71,6 +215,22 @@ def find_manifest(fn: str, manifest_dir: Path):
     raise FileNotFoundError(f"no file matching {fn} found in {manifest_dir}")
 
 
+def node_manifests(manifest_dir: Path) -> list[Path]:
+    """
+    one manifest per node in manifest_dir, chosen as find_manifest() would:
+    the base manifest, or its _coverage version if there is no base
+    manifest. coverage_utilz's _temp files are skipped.
+    """
+    manifests = {}
+    for path in sorted(manifest_dir.glob("*.parquet")):
+        if path.stem.endswith("_temp"):
+            continue
+        node = path.stem.removesuffix("_coverage")
+        if path.stem == node or node not in manifests:
+            manifests[node] = path
+    return list(manifests.values())
+
+
 def checksum_object(obj, hash_function=md5):
     """
     make stable byte array from python object. the general case of this is
@@ -114,6 +274,19 @@ def checksum_object(obj, hash_function=md5):
     return hasher.hexdigest()
 
 
+def is_hashed(data, key):
+    """does just_hash() hash this (loaded) object?"""
+    # pds4_tools label object
+    if '_convenient_root' in dir(data[key]):
+        return False
+    # ignore text-type objects for now (but not FITS headers)
+    if isinstance(data[key], MultiDict) and ("HEADER" not in key):
+        return False
+    if isinstance(data[key], str):
+        return False
+    return True
+
+
 def just_hash(data):
     hashes = {}
     for key in data.keys():
@@ -121,38 +294,99 @@ def just_hash(data):
         # membership in OBJECTS_IGNORED_BY_DEFAULT (like MODEL_DESC)
         if key not in dir(data):
             continue
-        # pds4_tools label object
-        if '_convenient_root' in dir(data[key]):
-            continue
-        # ignore text-type objects for now (but not FITS headers)
-        if isinstance(data[key], MultiDict) and ("HEADER" not in key):
-            continue
-        if isinstance(data[key], str):
-            continue
-        hashes[key] = checksum_object(data[key])
+        if is_hashed(data, key):
+            hashes[key] = checksum_object(data[key])
     return hashes
 
 
-def get_nodelist(xmlfile):
-    return ET.parse(xmlfile).getroot().findall(".//*")
+def load_and_hash(
+    data: Data, skiphash: bool = False, release: bool = False
+) -> tuple[dict[str, str], dict[str, dict[str, float]]]:
+    """
+    load the objects of a product one at a time (as data.load("all") would)
+    and hash each object as soon as it is loaded, rather than loading all of
+    them and then hashing them. if release is True, each hashed object is
+    deleted from data once it has been hashed, so that only one of them is
+    in memory at a time.
+
+    returns the hashes just_hash() would have returned after
+    data.load("all"), and each object's load and hash times. an object
+    loaded as a side effect of loading another has no loadtime.
+    """
+    from pdr.errors import AlreadyLoadedError
+    from pdr.loaders.dispatch import OBJECTS_IGNORED_BY_DEFAULT
+
+    watch = Stopwatch(digits=3, silent=True)
+    hashes, times, seen, hashable = {}, {}, set(), set()
+    # data.keys() may grow as objects load; like load_all(), iterate over it
+    # in place
+    for name in data.keys():
+        if (name in seen) or OBJECTS_IGNORED_BY_DEFAULT.match(name):
+            continue
+        watch.start()
+        try:
+            data.load(name)
+        except AlreadyLoadedError:
+            pass
+        times[name] = {"loadtime": watch.peek()}
+        loaded = dir(data)
+        for key in data.keys():
+            if key not in loaded:
+                continue
+            if key not in seen:
+                seen.add(key)
+                if not is_hashed(data, key):
+                    continue
+                hashable.add(key)
+                if skiphash is False:
+                    watch.click()
+                    hashes[key] = checksum_object(data[key])
+                    times.setdefault(key, {})["hashtime"] = watch.peek()
+            # also catches released objects lazy-loaded again by a later load
+            if (release is True) and (key in hashable):
+                delattr(data, key)
+    # same order as just_hash()
+    hashes = {key: hashes[key] for key in data.keys() if key in hashes}
+    return hashes, times
 
 
 def make_pds4_row(xmlfile):
-    nodelist = get_nodelist(xmlfile)
+    """
+    make an index row from a PDS4 label, streaming it with iterparse rather
+    than building the whole tree. also records the file_size and
+    md5_checksum given for each file, if any, as JSON objects keyed by
+    file name.
+    """
+    product_id, files, sizes, checksums = None, [], {}, {}
+    for _, node in ET.iterparse(xmlfile, events=("end",)):
+        tag = node.tag
+        if product_id is None and "logical_identifier" in tag:
+            product_id = node.text
+        elif "file_name" in tag:
+            files.append(node.text)
+        elif "file_size" in tag and len(files) > 0:
+            try:
+                sizes[files[-1]] = int(node.text)
+            except (TypeError, ValueError):
+                # empty or malformed file_size; don't lose the whole row
+                sizes[files[-1]] = None
+        elif "md5_checksum" in tag and len(files) > 0:
+            checksums[files[-1]] = node.text
+        # children have been read by the time their parent ends
+        node.clear()
+    if product_id is None:
+        raise ValueError(f"no logical_identifier found in {xmlfile}")
     return {
         "label_file": Path(xmlfile).name,
-        "product_id": next(
-            node for node in nodelist if "logical_identifier" in node.tag
-        ).text,
-        "files": json.dumps(
-            [node.text for node in nodelist if "file_name" in node.tag]
-            + [Path(xmlfile).name]
-        ),
+        "product_id": product_id,
+        "files": json.dumps(files + [Path(xmlfile).name]),
+        "file_size": json.dumps(sizes),
+        "md5_checksum": json.dumps(checksums),
     }
 
 
 def make_pds3_row(local_path):
-    metadata = pdr.pdr.Metadata(read_pvl(check_cases(local_path)))
+    metadata = pdr.pdr.Metadata(cached_read_pvl(check_cases(local_path)))
     files = [local_path.name]
     # TODO: use get_pds3_pointers here to decrease fragility
     targets = dig_for_values(
@@ -196,6 +430,17 @@ def get_product_row(label_path, url):
     return row
 
 
+def try_product_row(label_path, url):
+    """
+    get_product_row(), returning (row, None) on success and (None, error
+    message) on failure, so that one bad label does not stop a pool.
+    """
+    try:
+        return get_product_row(label_path, url), None
+    except Exception as ex:
+        return None, f"{type(ex).__name__}: {ex}"
+
+
 class HTTPSessionWrapper:
     def __init__(self, add_req_headers={}, retries=5, timeout=4, backoff=2):
         self.session = None
@@ -219,7 +464,7 @@ class HTTPSessionWrapper:
         self.session.close()
         self.session = None
 
-    def get_with_retries(self, url: str):
+    def get_with_retries(self, url: str, headers: Optional[dict] = None):
         if self.session is None:
             self.reset()
         base_url = url
@@ -228,7 +473,7 @@ class HTTPSessionWrapper:
         for _ in range(self.retries):
             try:
                 return self.session.get(
-                    url, stream=True, timeout=self.timeout
+                    url, stream=True, timeout=self.timeout, headers=headers
                 )
             except requests.ConnectTimeout:
                 msg = f"connection refused for {url}, reestablishing session"
@@ -270,8 +515,7 @@ def _expand_index_table(filelist, data_path, skip_files):
     recs = []
     for _, row in filelist.iterrows():
         baserec = row.to_dict()
-        files = json.loads(row['files'])
-        for f in files:
+        for f in row['files']:
             rec = baserec | {'url': f"{row['url_stem']}/{f}"}
             rec['dest'] = data_path / Path(rec['url']).name
             rec['exists'] = _casecheck_wrap(rec['dest'])
@@ -446,6 +690,98 @@ def _download_chunk(response, data_path, data_name):
     os.rename(temp_name, data_path / data_name)
 
 
+def fetch_attached_label(
+    url: str,
+    dest: Path,
+    session: HTTPSessionWrapper,
+    start_bytes: int = 2 ** 14,
+    max_bytes: int = DEFAULT_PVL_LIMIT,
+) -> bool:
+    """
+    fetch only the PDS3 label at the start of a file with an attached label
+    and write it to dest. requests byte ranges that double in size until
+    the end of the label turns up (or, if the server ignores Range, streams
+    the file until it does). like pdr's trim_label(), accepts a whole file
+    with no recognizable label ending if it is shorter than max_bytes.
+    returns True on success.
+    """
+    head, stop, eof = b"", start_bytes, False
+    while not eof and len(head) < max_bytes:
+        response = session.get_with_retries(
+            url, headers={"Range": f"bytes={len(head)}-{stop - 1}"}
+        )
+        if response is None:
+            console_and_log(f"Label fetch from {url} timed out.")
+            return False
+        try:
+            if response.status_code == 416:
+                # range starts past the end of the file
+                eof = True
+            elif not response.ok:
+                console_and_log(
+                    f"Label fetch from {url} failed: "
+                    f"{response.status_code} {response.reason}"
+                )
+                return False
+            elif response.status_code != 206:
+                # Range not supported: read the whole response, stopping
+                # once the label is complete
+                head = b""
+                for chunk in response.iter_content(chunk_size=start_bytes):
+                    head += chunk
+                    if find_label_end(head) is not None:
+                        break
+                    if len(head) >= max_bytes:
+                        break
+                else:
+                    eof = True
+                if find_label_end(head) is None and eof is False:
+                    # hit max_bytes with no end of label; a retry would
+                    # fetch the same bytes again
+                    break
+            else:
+                head += response.content
+                # a short read means we have reached the end of the file
+                eof = len(head) < stop
+        finally:
+            response.close()
+        if (end := find_label_end(head)) is None and eof is True:
+            # e.g. END as the last bytes of the file
+            end = len(head)
+        if end is not None and end <= max_bytes:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            dest.write_bytes(head[:end])
+            return True
+        stop *= 2
+    console_and_log(
+        f"No end of label found in the first {len(head)} bytes of {url}."
+    )
+    return False
+
+
+def fetch_label_heads(filelist, head_path, add_req_headers={}):
+    """
+    fetch just the labels of the attached-label files in filelist (which
+    must have 'url' and 'filename' columns) to head_path.
+    """
+    session = HTTPSessionWrapper(add_req_headers)
+    console_and_log(f"fetching labels of {len(filelist)} files...")
+    fetched = 0
+    for _, row in filelist.iterrows():
+        try:
+            fetched += fetch_attached_label(
+                row["url"], Path(head_path, row["filename"]), session
+            )
+        except KeyboardInterrupt:
+            raise
+        except Exception as ex:
+            console_and_log(
+                f"Label fetch from {row['url']} failed: "
+                f"{type(ex).__name__}: {ex}"
+            )
+    console_and_log(f"fetched {fetched}/{len(filelist)} labels.")
+
+
 def _verbose_web_temp_download_filelist(
     filelist, data_path, full_lower=False, add_req_headers={}
 ):
@@ -517,11 +853,15 @@ def read_and_hash(
     pdr_debug: bool,
     quiet: bool,
     skiphash: bool,
-    tracker: Optional[TrivialTracker] = None
-) -> tuple[Data, dict[str, str], dict[str, str]]:
+    tracker: Optional[TrivialTracker] = None,
+    keep_data: bool = True,
+) -> tuple[Optional[Data], dict[str, str], dict]:
     """
     read a product at a specified path, compute hashes from its data objects,
-    log appropriately
+    log appropriately. objects are loaded and hashed one at a time (see
+    load_and_hash()). if keep_data is False, each object is released once
+    it has been hashed and no Data object is returned, so that peak memory
+    use is that of the largest object rather than the whole product.
     """
     import astropy.io.fits.verify
     watch, runtimes = Stopwatch(digits=3, silent=True), {}
@@ -545,17 +885,26 @@ def read_and_hash(
         )
         watch.start()
         data = pdr.read(str(path), debug=pdr_debug, tracker=tracker)
-        data.load("all")
-        runtimes["readtime"] = watch.peek()
+        opentime = watch.peek()
+        hashes, object_times = load_and_hash(
+            data, skiphash, release=not keep_data
+        )
+    runtimes["readtime"] = round(
+        opentime + sum(t.get("loadtime", 0) for t in object_times.values()),
+        3
+    )
+    runtimes["object_times"] = object_times
     console_and_log(
         f"Opened {product['product_id']} ({runtimes['readtime']} s)",
         quiet=quiet
     )
-    watch.click()
+    if keep_data is False:
+        data = None
     if skiphash is True:
         return data, {}, runtimes
-    hashes = just_hash(data)
-    runtimes['hashtime'] = watch.peek()
+    runtimes['hashtime'] = round(
+        sum(t.get("hashtime", 0) for t in object_times.values()), 3
+    )
     console_and_log(
         f"Computed hashes for {product['product_id']} "
         f"({runtimes['hashtime']} s)", quiet=quiet
@@ -576,6 +925,7 @@ def record_comparison(
     if result != {}:
         log_row["status"] = "hash mismatch"
         log_row["error"] = str(result)
+        log_row["mismatch_keys"] = sorted(result)
     return log_row
 
 
@@ -595,10 +945,6 @@ def _casecheck_wrap(path):
         return False
 
 
-def list_datasets() -> list[str]:
-    return sorted(RULES_MODULES.keys())
-
-
 def _sync_chunks(bucket, tofetch, data_path):
     for chunk in chunked(tofetch, 20):
         chunk = tuple(chunk)
@@ -760,63 +1106,311 @@ def clean_logs():
     (Path(pdr_tests.__file__).parent / "pdrtests.log").unlink()
 
 
-def print_rules_list(dataset: Optional[str] = None):
-    rules = RULES_MODULES
-    if dataset is not None:
-        rules = {dataset: rules[dataset]}
-    for ds, mod in sorted(rules.items(), key=lambda kv: kv[0]):
-        print(f"- {ds}")
-        for ptype in sorted(mod.file_information.keys()):
-            print(f"  - {ptype} ({mod.file_information[ptype]['manifest']})")
-
-
-def _find_in_row_group(meta, ix, rgix, reader, mrecs, urls):
-    nrows = meta.row_group(rgix).num_rows
-    minix = mrecs[0]['index']
-    if minix > ix + nrows - 1:
-        return ix + nrows, rgix + 1, mrecs, urls
-    rg = reader.read_row_group(rgix)
-    while minix <= ix + nrows - 1:
-        # todo, maybe: pretty wasteful
-        row = rg.take([minix - ix]).to_pylist()[0]
-        urls.append('/'.join([row['domain'], row['url'], row['filename']]))
-        mrecs = mrecs[1:]
-        if len(mrecs) == 0:
-            break
-        minix = mrecs[0]['index']
-    return ix + nrows, rgix + 1, mrecs, urls
+def _take_manifest_rows(
+    manifest: Path, indices: Collection[int]
+) -> dict[int, str]:
+    """
+    fetch URLs for rows of a manifest by row index, reading only the row
+    groups (and columns) that contain them. returns a dict of index: URL.
+    """
+    offsets = row_group_offsets(manifest)
+    indices = np.unique(np.asarray(indices, dtype=np.int64))
+    # indices past the end of the manifest mean a stale filename table
+    indices = indices[(indices >= 0) & (indices < offsets[-1])]
+    if len(indices) == 0:
+        return {}
+    rows = take_manifest_rows(
+        manifest, indices, columns=["domain", "url", "filename"]
+    )
+    return {
+        ix: '/'.join(parts) for ix, parts in zip(
+            indices.tolist(),
+            zip(*(rows[c].to_pylist() for c in ("domain", "url", "filename")))
+        )
+    }
 
 
-def find_product(
-    filename_table_path: Path, manifest_path: Path, pid: str
-) -> list[str]:
+def _read_find_hits(filename_table_path: Path, stems: set[str]) -> pa.Table:
+    """
+    read all rows of the filename table whose stems are in 'stems', with
+    the table's mcodes metadata attached.
+    """
+    if not filename_table_path.is_dir():
+        table = read_manifest(
+            filename_table_path, filters=[('stem', 'in', list(stems))]
+        )
+        return table.replace_schema_metadata(
+            manifest_file(filename_table_path).schema_arrow.metadata
+        )
+    # sharded index written by write_find_index()
+    if (meta := read_find_index_metadata(filename_table_path)) is None:
+        raise FileNotFoundError(
+            f"No find index shards found in {filename_table_path}."
+        )
+    shards = {}
+    for stem in stems:
+        shard = find_index_shard(stem, meta["n_shards"])
+        shards.setdefault(shard, []).append(stem)
+    hits = [
+        read_manifest(
+            _find_index_shard_path(filename_table_path, shard),
+            filters=[('stem', 'in', shard_stems)],
+        )
+        for shard, shard_stems in sorted(shards.items())
+    ]
+    return pa.concat_tables(hits).replace_schema_metadata(
+        {b'mcodes': json.dumps(meta["mcodes"])}
+    )
+
+
+def find_products(
+    filename_table_path: Path, manifest_path: Path, pids: Collection[str]
+) -> dict[str, list[str]]:
+    """
+    find URLs for many filenames / product IDs at once. reads the filename
+    table once for all of them and each matching manifest once. returns a
+    dict of pid: list of URLs, with an empty list for unmatched pids.
+    """
     if not filename_table_path.exists():
         raise FileNotFoundError(
             f"Filename table not found at {filename_table_path}."
         )
 
     from cytoolz import groupby
-    from pyarrow import parquet as pq
 
-    res = pq.read_table(
-        filename_table_path,
-        filters=[('stem', '=', pid.split(".")[0].lower())]
-    )
+    stems = {pid: find_index_stem(pid) for pid in pids}
+    if len(stems) == 0:
+        return {}
+    res = _read_find_hits(filename_table_path, set(stems.values()))
     if len(res) == 0:
-        raise FileNotFoundError(f"No products found matching {pid}.")
+        return {pid: [] for pid in stems}
+    stem_urls = {stem: set() for stem in stems.values()}
     manifest_map = json.loads(res.schema.metadata[b'mcodes'].decode('ascii'))
     res = res.to_pylist()
     manifest_map = {int(k): v for k, v in manifest_map.items()}
     mgroups = groupby(lambda rec: rec['mcode'], res)
-    urls = []
     for mcode, mrecs in mgroups.items():
         manifest = find_manifest(manifest_map[mcode], manifest_path)
-        meta = pq.read_metadata(manifest)
-        reader = pq.ParquetFile(manifest).reader
-        mrecs = sorted(mrecs, key=lambda r: r['index'])
-        ix, rgix = 0, 0
-        while rgix < meta.num_row_groups and len(mrecs) > 0:
-            ix, rgix, mrecs, urls = _find_in_row_group(
-                meta, ix, rgix, reader, mrecs, urls
+        urls = _take_manifest_rows(manifest, [r['index'] for r in mrecs])
+        for rec in mrecs:
+            if (url := urls.get(rec['index'])) is not None:
+                stem_urls[rec['stem']].add(url)
+    return {pid: sorted(stem_urls[stem]) for pid, stem in stems.items()}
+
+
+def find_product(
+    filename_table_path: Path, manifest_path: Path, pid: str
+) -> list[str]:
+    urls = find_products(filename_table_path, manifest_path, [pid])[pid]
+    if len(urls) == 0:
+        raise FileNotFoundError(f"No products found matching {pid}.")
+    return urls
+
+
+def write_found_products(
+    found: Mapping[str, Sequence[str]], output: Optional[Path] = None
+):
+    """
+    write the results of find_products() as a table with one row per id and
+    URL (and a null URL for ids with no matches) to a .csv or .parquet file,
+    or print it as CSV if output is None.
+    """
+    table = pd.DataFrame(
+        [
+            {"id": pid, "url": url}
+            for pid, urls in found.items()
+            for url in (urls if len(urls) > 0 else [None])
+        ],
+        columns=["id", "url"],
+    )
+    if output is None:
+        print(table.to_csv(index=False), end="")
+        return
+    if output.suffix == ".parquet":
+        table.to_parquet(output, index=False)
+    else:
+        table.to_csv(output, index=False)
+    n_found = sum(len(urls) > 0 for urls in found.values())
+    console_and_log(
+        f"Found URLs for {n_found}/{len(found)} ids; wrote {output}"
+    )
+
+
+FIND_INDEX_SCHEMA = pa.schema(
+    [("stem", pa.string()), ("mcode", pa.int32()), ("index", pa.int64())]
+)
+FIND_INDEX_ROW_GROUP_SIZE = 65536
+
+
+def find_index_stem(pid: str) -> str:
+    return pid.split(".")[0].lower()
+
+
+def find_index_shard(stem: str, n_shards: int) -> int:
+    # crc32 rather than hash(), which is salted per interpreter
+    return zlib.crc32(stem.encode("utf-8")) % n_shards
+
+
+def _find_index_shard_path(index_path: Path, shard: int) -> Path:
+    return index_path / f"shard-{shard:03d}.parquet"
+
+
+def _manifest_state(manifest: Path) -> list[int]:
+    stat = manifest.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_find_index_metadata(index_path: Path) -> Optional[dict]:
+    """
+    read the manifest codes, manifest states, and shard count of a sharded
+    find index. returns None if index_path is not a sharded find index.
+    """
+    if not index_path.is_dir():
+        return None
+    if not (shard := _find_index_shard_path(index_path, 0)).exists():
+        return None
+    meta = manifest_file(shard).schema_arrow.metadata or {}
+    keys = (b"mcodes", b"mstates", b"n_shards")
+    if any(k not in meta for k in keys):
+        return None
+    return {k.decode("ascii"): json.loads(meta[k]) for k in keys}
+
+
+def _stage_manifest_stems(
+    manifest: Path, mcode: int, writers: dict, stage_dir: Path, n_shards: int
+) -> int:
+    """
+    stream the filenames of a manifest, writing (stem, mcode, index) rows
+    for each shard to that shard's staging file. returns number of rows.
+    """
+    import pyarrow.compute as pac
+    from pyarrow import parquet as pq
+
+    offset = 0
+    for batch in iter_manifest_batches(manifest, columns=["filename"]):
+        stems = pac.utf8_lower(
+            pac.extract_regex(
+                batch["filename"].fill_null(""), r"^(?P<stem>[^.]*)"
+            ).field("stem")
+        )
+        shards = np.array(
+            [find_index_shard(s, n_shards) for s in stems.to_pylist()],
+            dtype=np.int32
+        )
+        indices = np.arange(offset, offset + len(batch), dtype=np.int64)
+        for shard in np.unique(shards):
+            mask = pa.array(shards == shard)
+            part = pa.table(
+                [
+                    stems.filter(mask),
+                    pa.array(np.full(mask.true_count, mcode, np.int32)),
+                    pa.array(indices).filter(mask),
+                ],
+                schema=FIND_INDEX_SCHEMA
+            )
+            if shard not in writers:
+                writers[shard] = pq.ParquetWriter(
+                    _find_index_shard_path(stage_dir, shard),
+                    FIND_INDEX_SCHEMA
+                )
+            writers[shard].write_table(part)
+        offset += len(batch)
+    return offset
+
+
+def write_find_index(
+    manifest_dir: Path,
+    index_path: Path,
+    n_shards: int = 16,
+    rebuild: bool = False,
+):
+    """
+    build or refresh the filename index used by find_product(). the index is
+    a directory of n_shards Parquet files; each stem is assigned to a shard
+    by hash, and each shard is sorted by stem and written with row group
+    statistics, so that a lookup reads a single row group of a single shard.
+    only manifests that are new or have changed (by size or mtime) since the
+    last build are re-read; rows for deleted manifests are dropped.
+    """
+    import pyarrow.compute as pac
+    from pyarrow import parquet as pq
+
+    manifests = {p.name: p for p in node_manifests(manifest_dir)}
+    if len(manifests) == 0:
+        raise FileNotFoundError(f"No manifests found in {manifest_dir}.")
+    meta = None if rebuild is True else read_find_index_metadata(index_path)
+    if meta is None or meta["n_shards"] != n_shards:
+        meta = {"mcodes": {}, "mstates": {}, "n_shards": n_shards}
+    mcodes = {name: int(code) for code, name in meta["mcodes"].items()}
+    states = {name: _manifest_state(p) for name, p in manifests.items()}
+    keep = {
+        n: c for n, c in mcodes.items()
+        if n in manifests and meta["mstates"].get(n) == states[n]
+    }
+    stale = [n for n in manifests if n not in keep]
+    if len(stale) == 0 and len(keep) == len(mcodes):
+        console_and_log("Find index is up to date.")
+        return
+    next_code = max(mcodes.values(), default=-1) + 1
+    for name in stale:
+        if name not in mcodes:
+            mcodes[name], next_code = next_code, next_code + 1
+    mcodes = {n: c for n, c in mcodes.items() if n in manifests}
+    metadata = {
+        b"mcodes": json.dumps({str(c): n for n, c in mcodes.items()}),
+        b"mstates": json.dumps(states),
+        b"n_shards": json.dumps(n_shards),
+    }
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=index_path.parent) as stage:
+        stage_dir, writers = Path(stage), {}
+        out_dir = stage_dir / "out"
+        out_dir.mkdir()
+        try:
+            for name in stale:
+                console_and_log(f"Indexing filenames from {name}")
+                _stage_manifest_stems(
+                    manifests[name], mcodes[name], writers, stage_dir, n_shards
+                )
+        finally:
+            for writer in writers.values():
+                writer.close()
+        keep_codes = pa.array(list(keep.values()), pa.int32())
+        for shard in range(n_shards):
+            parts = []
+            if (
+                len(keep) > 0
+                and (old := _find_index_shard_path(index_path, shard)).exists()
+            ):
+                old = pq.read_table(old, schema=FIND_INDEX_SCHEMA)
+                parts.append(
+                    old.filter(pac.is_in(old["mcode"], value_set=keep_codes))
+                )
+            if shard in writers:
+                parts.append(
+                    pq.read_table(_find_index_shard_path(stage_dir, shard))
+                )
+            table = (
+                pa.concat_tables(parts) if len(parts) > 0
+                else FIND_INDEX_SCHEMA.empty_table()
+            )
+            pq.write_table(
+                table.sort_by("stem").replace_schema_metadata(metadata),
+                _find_index_shard_path(out_dir, shard),
+                row_group_size=FIND_INDEX_ROW_GROUP_SIZE,
+            )
+        if index_path.is_file():
+            console_and_log(f"Replacing unsharded index at {index_path}")
+            index_path.unlink()
+        index_path.mkdir(exist_ok=True)
+        for old in index_path.glob("shard-*.parquet"):
+            old.unlink()
+        for shard in range(n_shards):
+            os.replace(
+                _find_index_shard_path(out_dir, shard),
+                _find_index_shard_path(index_path, shard),
             )
-    return sorted(set(urls))
+    console_and_log(
+        f"Wrote find index for {len(mcodes)} manifests "
+        f"({len(stale)} reindexed) to {index_path}"
+    )
@@ -0,0 +1,114 @@
+"""
+on-disk cache of parsed PDS3 labels, shared by ix index, scan_headers and
+(optionally) ix test. entries are keyed by label path, size, mtime, read_pvl
+arguments and a digest of pdr's label parser, so that changes to a label or
+to the parser (including edits to an editable install of pdr) miss the
+cache rather than returning stale results.
+"""
+from contextlib import contextmanager
+from functools import cache, partial
+from hashlib import md5
+import os
+from pathlib import Path
+import pickle
+import re
+import tempfile
+from typing import Optional, Union
+
+import pdr
+import pdr.pdr
+from pdr.parselabel import pds3
+from pdr.parselabel.pds3 import read_pvl
+from pdr.parselabel.utils import KNOWN_LABEL_ENDINGS
+
+from pdr_tests.settings import SETTINGS
+
+
+def find_label_end(head: bytes) -> Optional[int]:
+    """
+    offset just past the end of the PVL label at the start of head, looking
+    for the same label endings (in the same order) as pdr's trim_label();
+    None if there isn't one.
+    """
+    for ending in KNOWN_LABEL_ENDINGS:
+        if (match := re.search(ending, head)) is not None:
+            return match.end()
+    return None
+
+
+@cache
+def parser_version() -> str:
+    """pdr version plus a digest of the source of pdr.parselabel."""
+    hasher = md5(pdr.__version__.encode(), usedforsecurity=False)
+    for source in sorted(Path(pds3.__file__).parent.glob("*.py")):
+        hasher.update(source.read_bytes())
+    return hasher.hexdigest()
+
+
+def _cache_entry(
+    filename: Union[str, Path],
+    cache_dir: Path,
+    read_kwargs: dict,
+) -> Path:
+    stat = os.stat(filename)
+    key = md5(
+        repr(
+            (
+                str(Path(filename).absolute()),
+                stat.st_size,
+                stat.st_mtime_ns,
+                sorted(read_kwargs.items()),
+                parser_version(),
+            )
+        ).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return Path(cache_dir, key[:2], f"{key}.pkl")
+
+
+def cached_read_pvl(
+    filename: Union[str, Path],
+    cache_dir: Optional[Path] = None,
+    **read_kwargs
+):
+    """
+    drop-in replacement for pdr.parselabel.pds3.read_pvl that reads from /
+    writes to the label cache.
+    """
+    if cache_dir is None:
+        cache_dir = SETTINGS.label_cache_dir
+    entry = _cache_entry(filename, cache_dir, read_kwargs)
+    try:
+        with entry.open("rb") as stream:
+            return pickle.load(stream)
+    except FileNotFoundError:
+        pass
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        # truncated or incompatible entry; reparse and overwrite it
+        pass
+    parsed = read_pvl(filename, **read_kwargs)
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    # write-then-rename, so concurrent readers never see partial entries
+    tempfd, temp_name = tempfile.mkstemp(dir=entry.parent, suffix=".part")
+    try:
+        with os.fdopen(tempfd, "wb") as stream:
+            pickle.dump(parsed, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_name, entry)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+    return parsed
+
+
+@contextmanager
+def cached_labels(cache_dir: Optional[Path] = None):
+    """
+    within this context, pdr.read() / pdr.Data parse PDS3 labels through
+    cached_read_pvl().
+    """
+    original = pdr.pdr.read_pvl
+    pdr.pdr.read_pvl = partial(cached_read_pvl, cache_dir=cache_dir)
+    try:
+        yield
+    finally:
+        pdr.pdr.read_pvl = original
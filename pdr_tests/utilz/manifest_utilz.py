@@ -0,0 +1,139 @@
+"""
+cached, memory-mapped read access to manifests and other large read-only
+parquet files (product lists, the filename table). file handles, footers
+and datasets are cached per path for the MAX_CACHED_FILES most recently
+used paths, and reopened if the file changes on disk. handles are not
+thread-safe.
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pac
+import pyarrow.dataset as ds
+from pyarrow import fs
+from pyarrow import parquet as pq
+
+# least recently used files' handles are dropped past this many files, so
+# that long-lived processes (e.g. ix serve) don't keep every manifest they
+# have ever read mapped
+MAX_CACHED_FILES = 32
+_HANDLES: OrderedDict[Path, dict[str, Any]] = OrderedDict()
+
+
+def _cached(path: Union[str, Path], kind: str, opener: Callable) -> Any:
+    path = Path(path).resolve()
+    stat = path.stat()
+    state = (stat.st_size, stat.st_mtime_ns)
+    if (handles := _HANDLES.get(path)) is None or handles["state"] != state:
+        handles = _HANDLES[path] = {"state": state}
+        while len(_HANDLES) > MAX_CACHED_FILES:
+            _HANDLES.popitem(last=False)
+    _HANDLES.move_to_end(path)
+    if kind not in handles:
+        handles[kind] = opener(path)
+    return handles[kind]
+
+
+def clear_manifest_cache():
+    _HANDLES.clear()
+
+
+def manifest_file(path: Union[str, Path]) -> pq.ParquetFile:
+    """memory-mapped ParquetFile for path, opened once per process."""
+    return _cached(path, "file", lambda p: pq.ParquetFile(p, memory_map=True))
+
+
+def manifest_metadata(path: Union[str, Path]) -> pq.FileMetaData:
+    return manifest_file(path).metadata
+
+
+def row_group_offsets(path: Union[str, Path]) -> np.ndarray:
+    """
+    index of the first row of each row group in path, followed by the total
+    number of rows.
+    """
+    def offsets(_):
+        meta = manifest_metadata(path)
+        return np.cumsum(
+            [0]
+            + [meta.row_group(i).num_rows for i in range(meta.num_row_groups)]
+        )
+
+    return _cached(path, "offsets", offsets)
+
+
+def _manifest_dataset(path: Union[str, Path]) -> ds.Dataset:
+    return _cached(
+        path,
+        "dataset",
+        lambda p: ds.dataset(
+            str(p),
+            format="parquet",
+            filesystem=fs.LocalFileSystem(use_mmap=True),
+        ),
+    )
+
+
+def read_manifest(
+    path: Union[str, Path],
+    columns: Optional[Sequence[str]] = None,
+    filters: Union[pac.Expression, list, None] = None,
+) -> pa.Table:
+    """
+    read a manifest, optionally reading only some columns and only rows
+    that match 'filters'. 'filters' may be an Expression or a list of
+    tuples in the format accepted by pyarrow.parquet.read_table; either is
+    checked against row group statistics before any data is read.
+    """
+    if filters is not None and not isinstance(filters, pac.Expression):
+        filters = pq.filters_to_expression(filters)
+    return _manifest_dataset(path).to_table(
+        columns=None if columns is None else list(columns), filter=filters
+    )
+
+
+def read_manifest_row_groups(
+    path: Union[str, Path],
+    row_groups: Sequence[int],
+    columns: Optional[Sequence[str]] = None,
+) -> pa.Table:
+    return manifest_file(path).read_row_groups(
+        list(row_groups), columns=None if columns is None else list(columns)
+    )
+
+
+def take_manifest_rows(
+    path: Union[str, Path],
+    indices: Sequence[int],
+    columns: Optional[Sequence[str]] = None,
+) -> pa.Table:
+    """
+    take rows of a manifest by sorted, unique row index, reading only the
+    row groups that contain them.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    offsets = row_group_offsets(path)
+    groups = np.searchsorted(offsets, indices, side="right") - 1
+    rgixs = np.unique(groups)
+    # offset of each selected row group within the concatenated table
+    starts = np.cumsum([0] + [offsets[g + 1] - offsets[g] for g in rgixs])
+    positions = (
+        indices - offsets[groups] + starts[np.searchsorted(rgixs, groups)]
+    )
+    return read_manifest_row_groups(path, rgixs.tolist(), columns).take(
+        pa.array(positions, pa.int64())
+    )
+
+
+def iter_manifest_batches(
+    path: Union[str, Path],
+    batch_size: int = 65536,
+    columns: Optional[Sequence[str]] = None,
+):
+    """yield record batches of a manifest, a row group at a time."""
+    yield from manifest_file(path).iter_batches(
+        batch_size, columns=None if columns is None else list(columns)
+    )
@@ -1,10 +1,15 @@
 from ast import literal_eval
 import re
+from urllib.parse import unquote
 
 from dustgoggles.structures import listify
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 from pyarrow import parquet as pq
 
+from pdr_tests.utilz.manifest_utilz import manifest_metadata
+
 MPIVOTS = ("dataset_pds", "dataset_ix", "ptype", "volume")
 MFILTERS = ("cov", "ucov", "inc", "all") 
 MTYPES = ("paths", "stats")
@@ -13,11 +18,16 @@ METRIC_FN_PATTERN = re.compile(
     rf"((?P<filt>{'|'.join(MFILTERS)})_)?"
     rf"((?P<mtype>{'|'.join(MTYPES)})\.csv)"
 )
+# hive partitioning of each {mtype}/{pivot} dataset in the metric store
+STORE_PARTITIONING = ds.partitioning(
+    pa.schema([("filt", pa.string()), ("manifest", pa.string())]),
+    flavor="hive"
+)
 
 
 def get_domain(manifest_fn):
     domains = set()
-    meta = pq.read_metadata(manifest_fn)
+    meta = manifest_metadata(manifest_fn)
     for n in range(meta.num_row_groups):
         rg = meta.row_group(n)
         domains.update(
@@ -35,6 +45,49 @@ def _maybeeval(x):
         return x
 
 
+def _eval_list_columns(df):
+    """literal_eval string columns that contain list-likes, in place"""
+    for k, v in df.items():
+        if len(v) == 0:
+            continue
+        if isinstance((sv := v.iloc[0]), str) and sv.startswith("["):
+            df[k] = v.map(_maybeeval)
+    return df
+
+
+def _normalize_null_types(table):
+    """
+    cast columns of null type (or lists of null type), which pyarrow infers
+    from all-null / all-empty columns, to strings (or lists of strings), so
+    that their types are compatible with the same column in other manifests.
+    """
+    fields = []
+    for field in table.schema:
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        elif (
+            pa.types.is_list(field.type)
+            and pa.types.is_null(field.type.value_type)
+        ):
+            field = field.with_type(pa.list_(pa.string()))
+        fields.append(field)
+    return table.cast(pa.schema(fields, table.schema.metadata))
+
+
+def _store_schema(root):
+    """
+    union of the schemas of all files in a {mtype}/{pivot} dataset of the
+    metric store (manifests need not all have the same columns)
+    """
+    files = ds.dataset(
+        root, format="parquet", partitioning=STORE_PARTITIONING
+    ).files
+    return pa.unify_schemas(
+        [pq.read_schema(f).remove_metadata() for f in files]
+        + [STORE_PARTITIONING.schema]
+    )
+
+
 def metric_catalog(path):
     cat = []
     for p in path.iterdir():
@@ -50,9 +103,18 @@ def measured_manifest_names(path):
 
 
 class MetricLoader:
+    """
+    loads coverage metrics. if the metric store (typed Parquet datasets
+    under coverage_metrics/store, one per mtype and pivot, partitioned by
+    filter and manifest name) has been built, metrics are read from it, with
+    filters pushed down to the partitions; otherwise they are parsed from the
+    CSV files in coverage_metrics. use build_store() to convert the CSVs.
+    load() prefers CSV files newer than the store: see its docstring.
+    """
     def __init__(self, path):
         self.metric_path = path / "coverage_metrics"
         self.manifest_path = path / "coverage_manifests"
+        self.store_path = self.metric_path / "store"
 
     @staticmethod
     def _compatible(match, filt, pivot, mtype):
@@ -62,6 +124,22 @@ class MetricLoader:
             for t, v in zip(("pivot", "filt", "mtype"), (pivot, filt, mtype))
         )
 
+    @staticmethod
+    def _check_options(pivot, mtype, filt):
+        if filt != "all" and mtype == "stats":
+            raise ValueError(
+                "filtered stats files do not exist. do not specify a value "
+                "for the 'filt' parameter if 'mtype' is 'stats'."
+            )
+        for name, val, opt in zip(
+            ("pivot", "filt", "mtype"),
+            (pivot, filt, mtype),
+            (MPIVOTS, MFILTERS, MTYPES)
+        ):
+            if val in opt:
+                continue
+            raise ValueError(f"invalid option: {name} must be one of {opt}.")
+
     def make_urls(self, pathtable):
         domains = {}
         for manifest_name in pathtable['manifest'].unique():
@@ -78,22 +156,12 @@ class MetricLoader:
             wheredf.loc[group.index, 'domain'] = domains[manifest]
         return "https://" + wheredf['domain'] + "/" + wheredf["path"]
 
-    def load(self, names, pivot="dataset_pds", mtype="stats", filt="all"):
-        if filt != "all" and mtype == "stats":
-            raise ValueError(
-                "filtered stats files do not exist. do not specify a value "
-                "for the 'filt' parameter if 'mtype' is 'stats'."
-            )
-        names = listify(names)
-        for name, val, opt in zip(
-            ("pivot", "filt", "mtype"),
-            (pivot, filt, mtype), 
-            (MPIVOTS, MFILTERS, MTYPES)
-        ):
-            if val in opt:
-                continue
-            raise ValueError(f"invalid option: {name} must be one of {opt}.")
-        dfs, unmatched = {}, set(names)
+    def _metric_csvs(self, names, pivot, mtype, filt):
+        """
+        ({manifest name: CSV file} for the metric CSV files matching
+        patterns in names and these options, patterns matching no CSV)
+        """
+        csvs, unmatched = {}, set(names)
         for p in self.metric_path.iterdir():
             if (match := re.match(METRIC_FN_PATTERN, p.name)) is None:
                 continue
@@ -103,23 +171,204 @@ class MetricLoader:
             unmatched.difference_update(pmatch)
             if not self._compatible(match, filt, pivot, mtype):
                 continue
-            dfs[match['name']] = pd.read_csv(p)
+            csvs[match['name']] = p
+        return csvs, unmatched
+
+    @staticmethod
+    def _read_csvs(csvs):
+        dfs = {name: pd.read_csv(p) for name, p in csvs.items()}
+        for k, v in dfs.items():
+            v['manifest'] = k
+        df = pd.concat(list(dfs.values()))
+        return _eval_list_columns(df).reset_index(drop=True).copy()
+
+    def load(
+        self,
+        names,
+        pivot="dataset_pds",
+        mtype="stats",
+        filt="all",
+        refresh_store=False,
+    ):
+        """
+        load metrics for manifests whose names match the regex patterns in
+        'names'. if the store has been built for these options, metrics are
+        read from it, except that metrics that only have a CSV file, or
+        whose CSV file is newer than their stored copy, are read from the
+        CSV file. if refresh_store is True, stale stored copies are instead
+        rewritten from their CSV files first.
+        """
+        self._check_options(pivot, mtype, filt)
+        names = listify(names)
+        csvs, unmatched = self._metric_csvs(names, pivot, mtype, filt)
+        stored = self._stored_partitions(pivot, mtype, filt)
+        unmatched = {
+            n for n in unmatched if not any(re.match(n, s) for s in stored)
+        }
         if len(unmatched) > 0:
             raise FileNotFoundError(
                 f"no matching files found for the following names:"
                 f"{', '.join(unmatched)}"
             )
-        if len(dfs) == 1:
-            df = tuple(dfs.values())[0]
-            df['manifest'] = tuple(dfs.keys())[0]
+        if len(stored) == 0:
+            return self._read_csvs(csvs)
+        from_csv = {}
+        for name, p in csvs.items():
+            if name in stored:
+                newest = max(
+                    (f.stat().st_mtime for f in stored[name].iterdir()),
+                    default=0
+                )
+                if p.stat().st_mtime <= newest:
+                    continue
+                if refresh_store is True:
+                    print(f"{p.name} is newer than the store; rewriting it")
+                    df = _eval_list_columns(pd.read_csv(p))
+                    self.write(df, name, pivot, mtype, filt)
+                    continue
+            from_csv[name] = p
+        from_store = [
+            s for s in stored
+            if any(re.match(n, s) for n in names) and s not in from_csv
+        ]
+        parts = []
+        if len(from_store) > 0:
+            parts.append(self._read_store(from_store, pivot, mtype, filt))
+        if len(from_csv) > 0:
+            parts.append(self._read_csvs(from_csv))
+        return pd.concat(parts).reset_index(drop=True)
+
+    def _stored_partitions(self, pivot, mtype, filt):
+        """{manifest name: partition directory} for these options"""
+        filt_path = self.store_path / mtype / pivot / f"filt={filt}"
+        if not filt_path.exists():
+            return {}
+        return {
+            unquote(p.name.split("=", 1)[1]): p
+            for p in filt_path.iterdir()
+            if p.name.startswith("manifest=")
+        }
+
+    def stored_names(self, pivot="dataset_pds", mtype="stats", filt="all"):
+        """names of manifests with metrics in the store for these options"""
+        return sorted(self._stored_partitions(pivot, mtype, filt))
+
+    def query(
+        self,
+        names=None,
+        pivot="dataset_pds",
+        mtype="stats",
+        filt="all",
+        columns=None,
+        filter=None,
+    ):
+        """
+        read metrics from the store. 'names' are regex patterns for manifest
+        names, as in load(); if None, read metrics for all manifests.
+        'columns' optionally selects columns, and 'filter' is an optional
+        pyarrow.dataset expression (e.g. ds.field('coverage') == 0). both
+        are pushed down to the Parquet reader.
+        """
+        self._check_options(pivot, mtype, filt)
+        available = self.stored_names(pivot, mtype, filt)
+        if names is None:
+            matched = available
         else:
-            for k, v in dfs.items():
-                v['manifest'] = k
-            df = pd.concat(list(dfs.values()))
-        for k, v in df.items():
-            if isinstance((sv := v.iloc[0]), str) and sv.startswith("["):
-                df[k] = v.map(_maybeeval)
-        return df.reset_index(drop=True).copy()
+            names, matched = listify(names), []
+            unmatched = set(names)
+            for name in available:
+                pmatch = {n for n in names if re.match(n, name)}
+                if len(pmatch) == 0:
+                    continue
+                unmatched.difference_update(pmatch)
+                matched.append(name)
+            if len(unmatched) > 0:
+                raise FileNotFoundError(
+                    f"no matching metrics found for the following names:"
+                    f"{', '.join(unmatched)}"
+                )
+        return self._read_store(matched, pivot, mtype, filt, columns, filter)
+
+    def _read_store(
+        self, matched, pivot, mtype, filt, columns=None, filter=None
+    ):
+        expression = (
+            (ds.field("filt") == filt) & ds.field("manifest").isin(matched)
+        )
+        if filter is not None:
+            expression = expression & filter
+        if columns is not None:
+            columns = [c for c in columns if c != "manifest"] + ["manifest"]
+        root = self.store_path / mtype / pivot
+        dataset = ds.dataset(
+            root,
+            format="parquet",
+            partitioning=STORE_PARTITIONING,
+            schema=_store_schema(root),
+        )
+        table = dataset.to_table(columns=columns, filter=expression)
+        if "filt" in table.column_names:
+            table = table.drop(["filt"])
+        df = table.to_pandas()
+        # return lists rather than arrays, as load() does for CSV files
+        for field in table.schema:
+            if pa.types.is_list(field.type):
+                df[field.name] = pd.Series(
+                    table[field.name].to_pylist(), dtype=object
+                )
+        return df
+
+    def write(self, df, name, pivot="dataset_pds", mtype="stats", filt="all"):
+        """
+        write metrics for a single manifest / pivot / mtype / filter to the
+        store, replacing any metrics previously stored for them. list-like
+        columns should contain actual lists, not their string reprs.
+        """
+        self._check_options(pivot, mtype, filt)
+        table = pa.Table.from_pandas(
+            df.drop(columns=["manifest"], errors="ignore"),
+            preserve_index=False,
+        )
+        root = self.store_path / mtype / pivot
+        table = _normalize_null_types(table)
+        if root.exists():
+            # keep the types of columns other manifests also have consistent
+            existing = _store_schema(root)
+            table = table.cast(
+                pa.schema(
+                    [
+                        existing.field(n) if n in existing.names
+                        else table.schema.field(n)
+                        for n in table.column_names
+                    ],
+                    table.schema.metadata,
+                )
+            )
+        for partition, value in (("filt", filt), ("manifest", name)):
+            table = table.append_column(
+                partition, pa.array([value] * len(table), pa.string())
+            )
+        pq.write_to_dataset(
+            table,
+            root,
+            partitioning=STORE_PARTITIONING,
+            basename_template="part-{i}.parquet",
+            existing_data_behavior="delete_matching",
+        )
+
+    def build_store(self):
+        """convert all metric CSV files to the Parquet metric store."""
+        for p in sorted(self.metric_path.iterdir()):
+            if (match := re.match(METRIC_FN_PATTERN, p.name)) is None:
+                continue
+            print(f"storing {p.name}")
+            self.write(
+                _eval_list_columns(pd.read_csv(p)),
+                match["name"],
+                match["pivot"],
+                match["mtype"],
+                "all" if match["filt"] is None else match["filt"],
+            )
 
 
 def pathtable_to_treeframe(pathtable):
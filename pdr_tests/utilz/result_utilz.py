@@ -0,0 +1,214 @@
+"""
+store of 'ix test' results: a Parquet dataset under settings.test_result_dir
+with one row per tested product, hive-partitioned by run id, data set and
+product type. run ids sort in order of run start time, so questions like
+'what has failed or slowed down since run X' are filters on the run_id
+partition rather than reads of many CSV logs.
+"""
+import datetime as dt
+from pathlib import Path
+import secrets
+from typing import Optional, Sequence, Union
+
+import pandas as pd
+import pdr
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import parquet as pq
+
+from pdr_tests.settings import SETTINGS
+
+RESULT_PARTITIONING = ds.partitioning(
+    pa.schema(
+        [
+            ("run_id", pa.string()),
+            ("dataset", pa.string()),
+            ("product_type", pa.string()),
+        ]
+    ),
+    flavor="hive",
+)
+RESULT_SCHEMA = pa.schema(
+    [
+        ("product_id", pa.string()),
+        ("status", pa.string()),
+        ("error", pa.string()),
+        ("filename", pa.string()),
+        ("readtime", pa.float64()),
+        ("hashtime", pa.float64()),
+        # per-object load and hash times (see ix_utilz.load_and_hash)
+        (
+            "object_times",
+            pa.map_(
+                pa.string(),
+                pa.struct(
+                    [("loadtime", pa.float64()), ("hashtime", pa.float64())]
+                ),
+            ),
+        ),
+        # names of objects whose hashes were new, missing or different
+        ("mismatch_keys", pa.list_(pa.string())),
+        ("pdr_version", pa.string()),
+        ("tested_at", pa.timestamp("s", tz="UTC")),
+    ]
+)
+
+
+def new_run_id() -> str:
+    """id for a test run: its UTC start time, plus a random suffix."""
+    now = dt.datetime.now(dt.timezone.utc)
+    return f"{now:%Y%m%dT%H%M%S}-{secrets.token_hex(2)}"
+
+
+def write_test_results(
+    log_df: pd.DataFrame,
+    run_id: str,
+    dataset: str,
+    product_type: str,
+    result_dir: Optional[Path] = None,
+):
+    """
+    add the test log for one product type in one run (as produced by
+    ProductChecker.compare_test_hashes) to the store, replacing any results
+    previously stored for that run and product type.
+    """
+    if result_dir is None:
+        result_dir = SETTINGS.test_result_dir
+    frame = log_df.reindex(columns=RESULT_SCHEMA.names)
+    frame["product_id"] = frame["product_id"].astype("string")
+    frame["filename"] = frame["filename"].astype("string")
+    # pandas can't convert empty (float64) columns to nested types, so
+    # build these columns in pyarrow
+    nested = {
+        "object_times": [
+            list(times.items()) if isinstance(times, dict) else None
+            for times in frame.pop("object_times")
+        ],
+        "mismatch_keys": [
+            keys if isinstance(keys, list) else []
+            for keys in frame.pop("mismatch_keys")
+        ],
+    }
+    frame["pdr_version"] = pdr.__version__
+    frame["tested_at"] = pd.Timestamp.now(tz="UTC").floor("s")
+    table = pa.Table.from_pandas(
+        frame,
+        schema=pa.schema([f for f in RESULT_SCHEMA if f.name not in nested]),
+        preserve_index=False,
+    )
+    # in schema order, so that each column lands at its schema position
+    for ix, field in enumerate(RESULT_SCHEMA):
+        if field.name in nested:
+            table = table.add_column(
+                ix, field, pa.array(nested[field.name], field.type)
+            )
+    for partition, value in zip(
+        RESULT_PARTITIONING.schema.names, (run_id, dataset, product_type)
+    ):
+        table = table.append_column(
+            partition, pa.array([value] * len(table), pa.string())
+        )
+    pq.write_to_dataset(
+        table,
+        result_dir,
+        partitioning=RESULT_PARTITIONING,
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+    )
+
+
+def _as_list(values: Union[str, Sequence[str]]) -> list[str]:
+    return [values] if isinstance(values, str) else list(values)
+
+
+def query_test_results(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    datasets: Union[str, Sequence[str], None] = None,
+    product_types: Union[str, Sequence[str], None] = None,
+    statuses: Union[str, Sequence[str], None] = None,
+    columns: Optional[Sequence[str]] = None,
+    filter: Optional[ds.Expression] = None,
+    result_dir: Optional[Path] = None,
+) -> pd.DataFrame:
+    """
+    read test results from the store. 'since' and 'until' are inclusive
+    bounds on run id (or any prefix of one, like '20240301'). 'datasets',
+    'product_types' and 'statuses' select those values. 'filter' is an
+    optional additional pyarrow.dataset expression, e.g.
+    ds.field('readtime') > 10. all of these are pushed down to the reader.
+    """
+    if result_dir is None:
+        result_dir = SETTINGS.test_result_dir
+    expression = ds.scalar(True)
+    if since is not None:
+        expression &= ds.field("run_id") >= since
+    if until is not None:
+        # so that a prefix includes every run id that starts with it
+        expression &= ds.field("run_id") <= f"{until}\uffff"
+    for field, values in (
+        ("dataset", datasets),
+        ("product_type", product_types),
+        ("status", statuses),
+    ):
+        if values is not None:
+            expression &= ds.field(field).isin(_as_list(values))
+    if filter is not None:
+        expression &= filter
+    dataset = ds.dataset(
+        result_dir,
+        format="parquet",
+        partitioning=RESULT_PARTITIONING,
+        schema=pa.unify_schemas([RESULT_SCHEMA, RESULT_PARTITIONING.schema]),
+    )
+    df = dataset.to_table(
+        columns=None if columns is None else list(columns),
+        filter=expression,
+    ).to_pandas()
+    if "mismatch_keys" in df.columns:
+        df["mismatch_keys"] = df["mismatch_keys"].map(list)
+    sort_by = [
+        c for c in ("run_id", "dataset", "product_type", "product_id")
+        if c in df.columns
+    ]
+    return df.sort_values(sort_by).reset_index(drop=True)
+
+
+def find_regressions(
+    since: str,
+    slowdown: float = 1.5,
+    result_dir: Optional[Path] = None,
+) -> pd.DataFrame:
+    """
+    products whose most recent result after run 'since' is worse than their
+    result in run 'since': they failed where they had passed, or their read
+    or hash time grew by more than a factor of 'slowdown'. returns one row
+    per regressed product with '_base' and '_latest' columns and a
+    'regression' column naming what got worse.
+    """
+    keys = ["dataset", "product_type", "product_id"]
+    fields = ["status", "error", "readtime", "hashtime"]
+    results = query_test_results(
+        since=since, columns=["run_id", *keys, *fields], result_dir=result_dir
+    )
+    base = results.loc[results["run_id"] == since]
+    latest = (
+        results.loc[results["run_id"] > since]
+        .drop_duplicates(keys, keep="last")
+    )
+    merged = base.merge(latest, on=keys, suffixes=("_base", "_latest"))
+    problems = pd.DataFrame(
+        {
+            "status": (merged["status_base"] == "ok")
+            & (merged["status_latest"] != "ok"),
+            **{
+                timing: merged[f"{timing}_latest"]
+                > merged[f"{timing}_base"] * slowdown
+                for timing in ("readtime", "hashtime")
+            },
+        }
+    )
+    merged["regression"] = [
+        " ".join(problems.columns[row]) for row in problems.to_numpy()
+    ]
+    return merged.loc[problems.any(axis=1)].reset_index(drop=True)
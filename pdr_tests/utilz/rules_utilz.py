@@ -0,0 +1,22 @@
+"""
+helpers for listing data sets and product types from selection rules.
+imported by the ix CLI at startup, so keep this module light: do not import
+pdr, pandas, pyarrow, etc. at top level here.
+"""
+from typing import Optional
+
+from pdr_tests.definitions import RULES_MODULES
+
+
+def list_datasets() -> list[str]:
+    return sorted(RULES_MODULES.keys())
+
+
+def print_rules_list(dataset: Optional[str] = None):
+    rules = RULES_MODULES
+    if dataset is not None:
+        rules = {dataset: rules[dataset]}
+    for ds, mod in sorted(rules.items(), key=lambda kv: kv[0]):
+        print(f"- {ds}")
+        for ptype in sorted(mod.file_information.keys()):
+            print(f"  - {ptype} ({mod.file_information[ptype]['manifest']})")
@@ -0,0 +1,110 @@
+"""
+support for 'ix serve', a local daemon that runs read-only ix actions in a
+long-lived process, so that they do not pay interpreter / pandas / pyarrow
+startup costs on every invocation. this module is imported by ix.py before
+anything else and must stay light: do not import pdr, pandas, pyarrow, etc.
+at top level here.
+"""
+from contextlib import redirect_stderr, redirect_stdout
+from io import StringIO
+from multiprocessing.connection import Client, Listener
+import os
+from pathlib import Path
+import sys
+from typing import Optional, Sequence
+
+# actions that have no side effects other than console output, and so may
+# be answered by the daemon
+SERVED_ACTIONS = ("find", "ls")
+
+
+def _run_served_action(cli, request: dict) -> dict:
+    stdout, stderr = StringIO(), StringIO()
+    cwd = os.getcwd()
+    try:
+        # resolve relative paths in arguments as the client would
+        os.chdir(request["cwd"])
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                code = cli.parse_args(request["argv"]).run()
+            except SystemExit as exit_:
+                # argparse errors and --help
+                code = exit_.code
+    finally:
+        os.chdir(cwd)
+    return {
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "code": 0 if code is None else code,
+    }
+
+
+def serve(address: Path, dispatcher):
+    """
+    answer requests to run SERVED_ACTIONS on a Unix socket at 'address'
+    until interrupted. 'dispatcher' is the CLIDispatcher for ix. requests
+    are handled one at a time, in this process, so that imported modules,
+    loaded selection rules and cached manifest metadata stay warm.
+    """
+    if address.exists():
+        if daemon_running(address):
+            raise FileExistsError(f"ix serve is already running at {address}")
+        # stale socket from a daemon that did not shut down cleanly
+        address.unlink()
+    address.parent.mkdir(parents=True, exist_ok=True)
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(str(address), family="AF_UNIX")
+    finally:
+        os.umask(umask)
+    print(f"ix serve listening on {address} (ctrl-c to stop)")
+    try:
+        while True:
+            with listener.accept() as conn:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    continue
+                if request.get("argv", [None])[0] not in SERVED_ACTIONS:
+                    conn.send(
+                        {
+                            "stdout": "",
+                            "stderr": "ix serve cannot run that action\n",
+                            "code": 2,
+                        }
+                    )
+                    continue
+                conn.send(_run_served_action(dispatcher, request))
+    except KeyboardInterrupt:
+        print("ix serve stopped")
+    finally:
+        listener.close()
+
+
+def daemon_running(address: Path) -> bool:
+    try:
+        Client(str(address), family="AF_UNIX").close()
+        return True
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+
+
+def run_on_daemon(argv: Sequence[str], address: Path) -> Optional[int]:
+    """
+    run an ix action on a running daemon and echo its output. returns the
+    action's exit code, or None if the action cannot be served or no daemon
+    is running, in which case the caller should run the action in-process.
+    """
+    if len(argv) == 0 or argv[0] not in SERVED_ACTIONS:
+        return None
+    if not address.exists():
+        return None
+    try:
+        with Client(str(address), family="AF_UNIX") as conn:
+            conn.send({"argv": list(argv), "cwd": os.getcwd()})
+            response = conn.recv()
+    except (ConnectionRefusedError, FileNotFoundError, EOFError):
+        return None
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["code"]